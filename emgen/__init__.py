@@ -0,0 +1,34 @@
+import importlib
+
+# Stage functions for use from other Python code, each taking the path of a
+# file. Call the configure(params) function of a stage's module first to set
+# its arguments, e.g. emgen.tile.configure({'output': path}); parser defaults
+# are used for any not given. Modules are imported on first use, so
+# importing emgen does not load mido or numpy
+
+# module of each stage function
+FUNCTIONS = {
+    'is_type1': 'smf_type1',
+    'scan': 'smf_type1',
+    'isolate_all': 'instrument_isolate',
+    'clean': 'data_cleanse',
+    'create_words': 'word',
+    'create_tiles': 'tile',
+    'process': 'pipeline',
+}
+
+
+# returns a stage function or module by name, importing its module
+def __getattr__(name):
+    if name in FUNCTIONS:
+        return getattr(importlib.import_module('.'+FUNCTIONS[name], __name__), name)
+    try:
+        return importlib.import_module('.'+name, __name__)
+    except ModuleNotFoundError as e:
+        if e.name != __name__+'.'+name:
+            raise
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(FUNCTIONS))
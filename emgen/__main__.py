@@ -0,0 +1,4 @@
+from .cli import main
+
+# python -m emgen <command>, the same as the emgen command
+main()
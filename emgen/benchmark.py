@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from mido import MidiFile, MidiTrack, Message, MetaMessage
+from . import smf
+from . import runner
+from . import smf_type1
+from . import instrument_isolate
+from . import data_cleanse
+from . import word
+from . import tile
+try:
+    import resource
+except ImportError:
+    # peak memory is not reported on Windows
+    resource = None
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will generate a seeded synthetic corpus of MIDI files, run emgen type1, emgen isolate, emgen cleanse, emgen word and emgen tile over it in turn, and report files/s, messages/s, peak memory and output counts for each stage. Results can be saved as a JSON baseline and compared with a later run over the same corpus'
+)
+parser.add_argument('-o', '--output', default=os.getcwd()+'/benchmark',
+                    help="Path to scratch directory for the corpus and stage outputs, which must be new or empty on the first run. The corpus and outputs of the last run are removed before each run, nothing else in it. (Defaults to benchmark in current working directory if not specified)")
+parser.add_argument('-n', '--files', default=100, type=int,
+                    help="Number of files in the corpus. (Defaults to 100 if not specified)")
+parser.add_argument('-sd', '--seed', default=0, type=int,
+                    help="Seed of the corpus generator, the same seed and settings give the same corpus. (Defaults to 0 if not specified)")
+parser.add_argument('-tr', '--tracks', default=4, type=int,
+                    help="Upper boundary of instrument tracks per file. (Defaults to 4 if not specified)")
+parser.add_argument('-pg', '--programs', default=16, type=int,
+                    help="Number of GM programs the instrument tracks are drawn from. (Defaults to 16 if not specified)")
+parser.add_argument('-nd', '--note_density', default=2.0, type=float,
+                    help="Average notes per beat in each track. (Defaults to 2 if not specified)")
+parser.add_argument('-ph', '--phrases', default=12, type=int,
+                    help="Number of phrases in each track. (Defaults to 12 if not specified)")
+parser.add_argument('-rp', '--repeat', default=0.6, type=float,
+                    help="Chance of a phrase repeating the one before it, from 0 to 1. (Defaults to 0.6 if not specified)")
+parser.add_argument('-sg', '--silence_gap', default=2.0, type=float,
+                    help="Upper boundary of the silence in beats between phrases. (Defaults to 2 beats if not specified)")
+parser.add_argument('-tc', '--tempo_changes', default=2, type=int,
+                    help="Upper boundary of tempo changes per file. (Defaults to 2 if not specified)")
+parser.add_argument('-mp', '--multi_pass', action='store_true',
+                    help="Benchmark the original multi pass isolation of emgen isolate. (Single pass if not specified)")
+parser.add_argument('-sb', '--save_baseline', default=None,
+                    help="Path of JSON file to save the results to. (Not saved if not specified)")
+parser.add_argument('-b', '--baseline', default=None,
+                    help="Path of JSON file saved by an earlier run to compare the results with. (Not compared if not specified)")
+runner.add_arguments(parser)
+
+# settings that determine the generated corpus, results are only comparable
+# with a baseline generated from the same values
+CORPUS_SETTINGS = ['files', 'seed', 'tracks', 'programs', 'note_density',
+                   'phrases', 'repeat', 'silence_gap', 'tempo_changes']
+
+KEYS = ['C', 'G', 'F', 'D', 'Bb', 'Am', 'Em', 'Dm', 'Cm', 'Gm']
+
+
+# returns a phrase of (note, note length) pairs in ticks
+def make_phrase(r, ticks_per_beat, note_density):
+    length = max(1, int(ticks_per_beat / note_density))
+    return [(r.randint(40, 84), r.choice([length // 2 or 1, length, length * 2]))
+            for _ in range(r.randint(3, 8))]
+
+
+# saves a synthetic MIDI file to path, the same for the same seed and settings.
+# Every tenth file is SMF type 0 and every third has a drum track
+def make_file(path, seed, settings):
+    r = random.Random(seed)
+    ticks_per_beat = 480
+    mid = MidiFile(type=0 if seed % 10 == 9 else 1, ticks_per_beat=ticks_per_beat)
+
+    # header track with tempo changes spread over the first phrases
+    header = MidiTrack()
+    header.append(MetaMessage('set_tempo', tempo=r.randint(300000, 900000), time=0))
+    header.append(MetaMessage('time_signature', numerator=r.choice([3, 4]), denominator=4, time=0))
+    header.append(MetaMessage('key_signature', key=r.choice(KEYS), time=0))
+    for _ in range(r.randint(0, settings['tempo_changes'])):
+        header.append(MetaMessage('set_tempo', tempo=r.randint(300000, 900000),
+                                  time=ticks_per_beat * r.randint(4, 16)))
+    mid.tracks.append(header)
+
+    channels = [c for c in range(16) if c != 9]
+    for channel in channels[:r.randint(1, settings['tracks'])]:
+        track = MidiTrack()
+        track.append(Message('program_change', program=r.randrange(settings['programs']),
+                             channel=channel, time=0))
+        track.append(Message('control_change', control=7, value=100, channel=channel, time=0))
+        phrase = make_phrase(r, ticks_per_beat, settings['note_density'])
+        for _ in range(settings['phrases']):
+            if r.random() >= settings['repeat']:
+                phrase = make_phrase(r, ticks_per_beat, settings['note_density'])
+            gap = int(ticks_per_beat * settings['silence_gap'] * r.random())
+            for i, (note, length) in enumerate(phrase):
+                velocity = r.choice([64, 80, 100])
+                track.append(Message('note_on', note=note, velocity=velocity,
+                                     channel=channel, time=gap if i == 0 else 0))
+                track.append(Message('note_off', note=note, velocity=0,
+                                     channel=channel, time=length))
+        mid.tracks.append(track)
+
+    if seed % 3 == 0:
+        track = MidiTrack()
+        track.append(Message('program_change', program=0, channel=9, time=0))
+        for _ in range(settings['phrases'] * 4):
+            track.append(Message('note_on', note=36, velocity=100, channel=9, time=ticks_per_beat // 2))
+            track.append(Message('note_off', note=36, velocity=0, channel=9, time=ticks_per_beat // 2))
+        mid.tracks.append(track)
+
+    if mid.type == 0:
+        mid.tracks = [MidiTrack(msg for track in mid.tracks for msg in track)]
+    mid.save(path)
+
+
+# generates the corpus into directory, returns list of file paths
+def generate(directory, settings):
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    files = []
+    for i in range(settings['files']):
+        path = directory+'/synthetic_%05d.mid' % i
+        make_file(path, settings['seed'] * 1000003 + i, settings)
+        files.append(path)
+    return files
+
+
+# each stage as (name, module, entry function, input directory, output
+# directory of the files it saves, executor used by the stage script)
+STAGES = [('smf_type1', smf_type1, 'scan', '/corpus', '/type_1', ThreadPoolExecutor),
+          ('instrument_isolate', instrument_isolate, 'isolate_all', '/type_1', '/source_separated', ProcessPoolExecutor),
+          ('data_cleanse', data_cleanse, 'clean', '/source_separated', '/cleaned', ProcessPoolExecutor),
+          ('word', word, 'create_words', '/cleaned', '/words', ProcessPoolExecutor),
+          ('tile', tile, 'create_tiles', '/cleaned', '/tiles', ProcessPoolExecutor)]
+
+
+# file marking a scratch directory as created by the benchmark
+MARKER = '.emgen_benchmark'
+
+
+# removes the corpus, stage outputs and metadata index of an earlier run
+# from the scratch directory, and nothing else. A directory that is not empty
+# is only used if the benchmark created it
+def clear(scratch_dir):
+    if os.path.isdir(scratch_dir) and os.listdir(scratch_dir) and not os.path.exists(scratch_dir+'/'+MARKER):
+        raise SystemExit('benchmark: %s is not empty and was not created by emgen benchmark, '
+                         'pass a new or empty directory as -o' % scratch_dir)
+    for name in ['/corpus', '/word_metadata', '/tile_metadata'] + [stage[4] for stage in STAGES]:
+        shutil.rmtree(scratch_dir+name, ignore_errors=True)
+    for suffix in ['', '-wal', '-shm']:
+        try:
+            os.remove(scratch_dir+'/metadata.sqlite'+suffix)
+        except FileNotFoundError:
+            pass
+    Path(scratch_dir).mkdir(parents=True, exist_ok=True)
+    open(scratch_dir+'/'+MARKER, 'w').close()
+
+
+# returns number of output files reported by a stage entry function
+def output_count(result):
+    if isinstance(result, dict):
+        return 1 if result['copied'] else 0
+    return len(result)
+
+
+# returns peak resident memory in MB of this process and its finished
+# child processes, or None where it cannot be measured
+def peak_rss():
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+# runs one stage over the output of the stage before it and returns its
+# results. Called in a new process for each stage, so peak memory is its own
+def run_stage(index, scratch_dir, jobs, multi_pass):
+    name, module, function_name, input_dir, new_dir, executor = STAGES[index]
+    params = {'output': scratch_dir, 'jobs': jobs}
+    module.configure(params)
+    function = getattr(module, function_name)
+    if name == 'instrument_isolate' and multi_pass:
+        function = module.isolate_all_multi_pass
+    Path(scratch_dir+new_dir).mkdir(parents=True, exist_ok=True)
+
+    files = sorted(str(path) for path in Path(scratch_dir+input_dir).rglob('*.mid'))
+    messages = sum(sum(len(rows) for rows in smf.load(filepath).tracks)
+                   for filepath in files)
+
+    errors = []
+    outputs = 0
+    start = time.perf_counter()
+    for file, result in runner.run(function, files, jobs, errors, executor=executor,
+                                   initializer=module.configure, initargs=(params,)):
+        outputs += output_count(result)
+    seconds = time.perf_counter() - start
+
+    return {'files': len(files), 'messages': messages, 'seconds': seconds,
+            'files_per_second': len(files) / seconds if seconds else None,
+            'messages_per_second': messages / seconds if seconds else None,
+            'peak_rss_mb': peak_rss(), 'outputs': outputs, 'errors': len(errors)}
+
+
+# prints results of each stage, with the speed relative to a baseline if given
+def report(results, baseline=None):
+    print('%-20s %7s %10s %9s %10s %12s %9s %8s' % (
+        'stage', 'files', 'messages', 'seconds', 'files/s', 'messages/s', 'peak MB', 'outputs'))
+    for name, stage in results['stages'].items():
+        line = '%-20s %7d %10d %9.2f %10.1f %12.0f %9s %8d' % (
+            name, stage['files'], stage['messages'], stage['seconds'],
+            stage['files_per_second'] or 0, stage['messages_per_second'] or 0,
+            '%.1f' % stage['peak_rss_mb'] if stage['peak_rss_mb'] is not None else '-',
+            stage['outputs'])
+        if baseline is not None and name in baseline['stages']:
+            before = baseline['stages'][name]
+            line += '   %.2fx baseline speed' % (before['seconds'] / stage['seconds'])
+            if before['outputs'] != stage['outputs']:
+                line += ', outputs differ (%d in baseline)' % before['outputs']
+        print(line)
+
+
+# generate the corpus, run each stage in turn and report the results
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    scratch_dir = params['output']
+    settings = {name: params[name] for name in CORPUS_SETTINGS}
+
+    clear(scratch_dir)
+    generate(scratch_dir+'/corpus', settings)
+
+    results = {'settings': settings, 'jobs': params['jobs'],
+               'multi_pass': params['multi_pass'], 'stages': {}}
+    for index, stage in enumerate(STAGES):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results['stages'][stage[0]] = pool.submit(
+                run_stage, index, scratch_dir, params['jobs'], params['multi_pass']).result()
+
+    baseline = None
+    if params['baseline'] is not None:
+        with open(params['baseline'], 'r') as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print('Baseline corpus settings differ, speeds are not comparable: %s' %
+                  baseline['settings'])
+    report(results, baseline)
+
+    if params['save_baseline'] is not None:
+        with open(params['save_baseline'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
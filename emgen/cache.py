@@ -0,0 +1,124 @@
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from . import events
+from . import smf
+from . import pack
+
+# adds the --cache_dir argument shared by every stage to an argument parser
+def add_arguments(parser):
+    parser.add_argument('-cd', '--cache_dir', default=None,
+                        help="Path to a directory of decoded event arrays shared by every script, read instead of parsing a MIDI file again. (Not used if not specified)")
+
+
+# number of parsed files kept in memory by each process
+memory_size = 32
+
+# directory of the on-disk tier, None if not used
+cache_dir = None
+
+# parsed files in least recently used order, by (path, size, mtime)
+memory = OrderedDict()
+
+
+# sets the on-disk tier directory, None to turn it off, and the number of
+# parsed files kept in memory
+def configure(directory, size=32):
+    global cache_dir, memory_size
+    cache_dir = directory
+    memory_size = size
+    while len(memory) > memory_size:
+        memory.popitem(last=False)
+
+
+# returns (absolute path, size, mtime) of a file, the key of its entries.
+# A file within a packed corpus is keyed by its content hash instead of mtime
+def file_key(filepath):
+    if pack.is_member(filepath):
+        size, mtime, digest = pack.stat(filepath)
+        return os.path.abspath(filepath), size, digest
+    st = os.stat(filepath)
+    return os.path.abspath(filepath), st.st_size, st.st_mtime_ns
+
+
+# returns path of the on-disk entry for a key. The event array layout is part
+# of the name, so entries written before it changed are not read
+def disk_path(key):
+    digest = hashlib.blake2b(repr((key, events.EVENT_DTYPE.descr)).encode(),
+                             digest_size=16).hexdigest()
+    return cache_dir+'/'+digest[:2]+'/'+digest+'.pickle'
+
+
+# returns EventTable of the on-disk entry for a key, or None if not found
+def read_disk(key):
+    try:
+        with open(disk_path(key), 'rb') as f:
+            tracks, ticks_per_beat, extras, smf_type = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return events.EventTable(tracks, ticks_per_beat, extras, smf_type)
+
+
+# writes EventTable as the on-disk entry for a key. Written then renamed, so
+# scripts reading the same directory never see half an entry
+def write_disk(key, table):
+    path = disk_path(key)
+    Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+    with open(path+'.%d.tmp' % os.getpid(), 'wb') as f:
+        pickle.dump((table.tracks, table.ticks_per_beat, table.extras, table.type),
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path+'.%d.tmp' % os.getpid(), path)
+
+
+# returns the cache entry of a file, a dict of its EventTable and derived
+# facts. Looked up in memory, then on disk, then parsed and stored in both
+def entry(filepath):
+    key = file_key(filepath)
+    found = memory.get(key)
+    if found is not None:
+        memory.move_to_end(key)
+        return found
+    table = read_disk(key) if cache_dir is not None else None
+    if table is None:
+        table = smf.load(filepath)
+        if cache_dir is not None:
+            write_disk(key, table)
+    found = {'table': table, 'facts': {}}
+    memory[key] = found
+    if len(memory) > memory_size:
+        memory.popitem(last=False)
+    return found
+
+
+# returns a copy of the EventTable of an entry, sharing its derived facts,
+# so callers may change the arrays without changing the cached ones
+def copy_table(found):
+    table = found['table']
+    copy = events.EventTable([rows.copy() for rows in table.tracks], table.ticks_per_beat,
+                             list(table.extras), table.type)
+    copy.facts = found['facts']
+    return copy
+
+
+# loads file path as EventTable, as events.load does
+def load(filepath):
+    return copy_table(entry(filepath))
+
+
+# facts derived from an EventTable, by name
+FACTS = {
+    'tempo_map': lambda table: events.tempo_map(table.tracks, table.ticks_per_beat),
+    'tempo': lambda table: events.find_tempo(table.tracks),
+    'channel': lambda table: events.find_channel(table.tracks),
+    'program_change': lambda table: events.find_program_change(table.tracks),
+}
+
+
+# returns a fact of an EventTable, derived once and kept with the table.
+# Only for tables that are not changed after the first call
+def fact(table, name):
+    if name not in table.facts:
+        table.facts[name] = FACTS[name](table)
+    return table.facts[name]
@@ -0,0 +1,49 @@
+import sys
+import argparse
+import importlib
+
+# module and description of each command. A command's module, and mido and
+# numpy with it, are only imported when that command is run
+COMMANDS = {
+    'pack': ('pack', 'concatenate a folder of MIDI files into one packed corpus'),
+    'type1': ('smf_type1', 'copy the SMF type 1 files of a folder'),
+    'isolate': ('instrument_isolate', 'split files into one file per instrument'),
+    'cleanse': ('data_cleanse', 'keep only the messages words and tiles are made from'),
+    'word': ('word', 'save passages of music surrounded by silence'),
+    'tile': ('tile', 'save repeated passages of music'),
+    'pipeline': ('pipeline', 'run every stage over each file in memory'),
+    'features': ('features', 'compute music features of every word and tile in the metadata index'),
+    'merge': ('merge', 'combine the manifests and metadata indexes of a run split with --shard'),
+    'query': ('metadata', 'print the words and tiles matching a query'),
+    'mashup': ('mashup', 'save pairs of words or tiles that fit together'),
+    'benchmark': ('benchmark', 'time every stage over a synthetic corpus'),
+}
+
+# argument parser for the command name, the rest is parsed by the command
+parser = argparse.ArgumentParser(
+    prog='emgen',
+    description='Will run one of the emotional-music-gen commands. Pass -h after the command for its arguments',
+    epilog='commands: '+'; '.join('%s - %s' % (name, text) for name, (module, text) in COMMANDS.items())
+)
+parser.add_argument('command', choices=list(COMMANDS),
+                    help="Command to run. (Required)")
+parser.add_argument('arguments', nargs=argparse.REMAINDER,
+                    help="Arguments of the command. (None if not specified)")
+
+
+# returns the module of a command, imported on first use
+def load(command):
+    return importlib.import_module('.'+COMMANDS[command][0], __package__)
+
+
+# runs the command named by the first of a list of arguments (the process
+# arguments if None) with the rest of them
+def main(argv=None):
+    params = vars(parser.parse_args(sys.argv[1:] if argv is None else argv))
+    module = load(params['command'])
+    module.parser.prog = 'emgen '+params['command']
+    module.main(params['arguments'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import numpy as np
+import os
+import argparse
+from pathlib import Path
+from . import events
+from . import runner
+from . import pack
+from . import manifest
+from . import metrics
+from . import cache
+from . import smf
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take a folder of source-separated MIDI files, filter out duplicate/non-essential messages, and save to new files within separate instrument directories. Make sure data is passed through emgen type1 and emgen isolate first to ensure input set is all SMF Type 1 and source separated'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+runner.add_arguments(parser)
+runner.add_shard_arguments(parser)
+cache.add_arguments(parser)
+manifest.add_arguments(parser)
+
+
+# stores stage arguments as module variables. Takes dict of argument values,
+# parser defaults are used for any not given
+def configure(params):
+    global output_dir
+    output_dir = runner.argument(parser, params, 'output')
+    cache.configure(runner.argument(parser, params, 'cache_dir'))
+
+
+configure({})
+
+
+# list of accepted message types to help filter any unwanted ones
+goodmessages = [events.NOTE_ON, events.NOTE_OFF, events.PROGRAM_CHANGE,
+                events.SET_TEMPO, events.TIME_SIGNATURE, events.KEY_SIGNATURE]
+
+
+# Function to check validity of EventTable object.
+# Takes EventTable as argument and returns true if more than one
+# note_on message is contained, returns false otherwise.
+def is_valid(table):
+    return events.is_valid(table.tracks)
+
+
+# Function to process source separated EventTable, by trimming any start and
+# end silence, removing nonessential channel and system messages.
+# Returns instrument number and new EventTable
+def clean_table(table):
+
+    # in the event that an instrument-isolated file contains multiple tracks of the same instrument,
+    # this will ensure that when the start time is trimmed, the timing is all kept correct
+    start_times = []
+    for rows in table.tracks:
+        # finds first note_on message time, i.e. starting time
+        # for all tracks in file
+        note_ons = np.flatnonzero(rows['type'] == events.NOTE_ON)
+        if len(note_ons):
+            start_times.append(rows['delta'][note_ons[0]])
+    # if no start time, file has no note on messages and is invalid
+    first_start_time = min(start_times) if start_times else 0
+
+    instrument = None
+    newtracks = []
+    # iterate through tracks in file
+    for i, rows in enumerate(table.tracks):
+        # finds last program change message to store instrument number
+        programs = rows['program'][rows['type'] == events.PROGRAM_CHANGE]
+        if len(programs):
+            instrument = int(programs[-1])
+
+        # ensures no unwanted messages are kept
+        keep = np.isin(rows['type'], goodmessages)
+
+        # each processed file will have one of each: tempo, time signature
+        # and key signature messages, the first one with a time delta of 0
+        for code in (events.SET_TEMPO, events.TIME_SIGNATURE, events.KEY_SIGNATURE):
+            found = np.flatnonzero(rows['type'] == code)
+            keep[found] = False
+            at_zero = found[rows['delta'][found] == 0]
+            if len(at_zero):
+                keep[at_zero[0]] = True
+        newrows = rows[keep]
+
+        # time signatures are rewritten with only numerator and denominator kept
+        timesig = newrows['type'] == events.TIME_SIGNATURE
+        newrows['data'][timesig] = (newrows['data'][timesig] & 0xffff) | 24 << 16 | 8 << 24
+
+        # ensures first note on message has time delta of zero,
+        # adjusts other potential tracks to equivalent time difference
+        note_ons = np.flatnonzero(newrows['type'] == events.NOTE_ON)
+        if len(note_ons):
+            newrows['delta'][note_ons[0]] -= first_start_time
+        newrows['tick'] = np.cumsum(newrows['delta'])
+
+        # keep header track and all other tracks with a program change
+        if i == 0 or len(programs) > 0:
+            newtracks.append(newrows)
+
+    newtable = events.EventTable(
+        newtracks, table.ticks_per_beat, table.extras)
+    return instrument, newtable
+
+
+# Function to process source separated MIDI file and save the cleaned file,
+# returns list holding the saved path, empty if the file was invalid
+def clean(filepath):
+    instruments = runner.load_instruments()
+    with metrics.timed('parse'):
+        table = cache.load(filepath)
+    metrics.count('messages_processed', sum(len(rows) for rows in table.tracks))
+    instrument, newtable = clean_table(table)
+
+    # create new directory to store output
+    new_dir = output_dir+'/cleaned/'+instruments[instrument]+'/'
+    Path(new_dir).mkdir(parents=True, exist_ok=True)
+    file_name = os.path.basename(filepath)
+
+    # validates and saves new file
+    with metrics.timed('validate'):
+        valid = is_valid(newtable)
+    if valid:
+        with metrics.timed('write'):
+            smf.save(newtable, new_dir+file_name)
+        metrics.count('files_saved')
+        return [new_dir+file_name]
+    else:
+        print('Invalid file not saved: %s' % filepath)
+        metrics.count('files_invalid')
+        return []
+
+
+# add all file paths to list, pass each file through clean()
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    configure(params)
+    input_dir = params['input']
+    jobs = params['jobs']
+    stage = runner.shard_name('data_cleanse', params['shard'])
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    newlist = pack.files(input_dir)
+    newlist = runner.shard_files(newlist, input_dir, params['shard'])
+    stage_params = {}
+    stage_manifest = manifest.Manifest(
+        output_dir+'/%s.jsonl' % runner.shard_name('cleaned_manifest', params['shard']), stage_params)
+    todo = stage_manifest.pending(newlist, params['force'])
+    errors = []
+    for file, outputs in runner.run(clean, todo, jobs, errors,
+                                    initializer=configure, initargs=(params,),
+                                    stage=stage):
+        stage_manifest.record(file, outputs)
+    stage_manifest.close()
+    runner.report_errors(errors, output_dir, stage)
+    metrics.report(output_dir, stage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import io
+import numpy as np
+from mido import MidiFile, MidiTrack, Message, MetaMessage
+from . import pack
+
+# message type codes stored in the 'type' column. Messages the pipeline does
+# not need as columns are stored as OTHER, with the original message kept
+# in the table's extras list and its index stored in the 'data' column
+NOTE_ON = 0
+NOTE_OFF = 1
+PROGRAM_CHANGE = 2
+SET_TEMPO = 3
+TIME_SIGNATURE = 4
+KEY_SIGNATURE = 5
+END_OF_TRACK = 6
+OTHER = 7
+
+TYPE_CODES = {
+    'note_on': NOTE_ON,
+    'note_off': NOTE_OFF,
+    'program_change': PROGRAM_CHANGE,
+    'set_tempo': SET_TEMPO,
+    'time_signature': TIME_SIGNATURE,
+    'key_signature': KEY_SIGNATURE,
+    'end_of_track': END_OF_TRACK,
+}
+
+# key signatures ordered by number of sharps (-7 to 7), majors then minors,
+# the 'data' column of a key_signature row holds the index into this list
+KEY_NAMES = ['Cb', 'Gb', 'Db', 'Ab', 'Eb', 'Bb', 'F', 'C', 'G', 'D', 'A', 'E', 'B', 'F#', 'C#',
+             'Abm', 'Ebm', 'Bbm', 'Fm', 'Cm', 'Gm', 'Dm', 'Am', 'Em', 'Bm', 'F#m', 'C#m', 'G#m', 'D#m', 'A#m']
+KEY_INDEX = {key: i for i, key in enumerate(KEY_NAMES)}
+
+DEFAULT_TEMPO = 500000
+
+# one row per message, -1 marks a field the message does not have
+EVENT_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('channel', 'i1'),
+    ('note', 'i1'),
+    ('velocity', 'i1'),
+    ('program', 'i1'),
+    ('data', 'i8'),
+    ('delta', 'i8'),
+    ('tick', 'i8'),
+    ('seconds', 'f8'),
+])
+
+
+# packs time signature fields into one integer, returns None if they do not fit
+def pack_time_signature(msg):
+    denominator = msg.denominator.bit_length() - 1
+    fields = (msg.numerator, denominator,
+              msg.clocks_per_click, msg.notated_32nd_notes_per_beat)
+    if any(value < 0 or value > 255 for value in fields) or 1 << denominator != msg.denominator:
+        return None
+    return fields[0] | fields[1] << 8 | fields[2] << 16 | fields[3] << 24
+
+
+# reverses pack_time_signature, returns MetaMessage
+def unpack_time_signature(data, time):
+    return MetaMessage('time_signature', numerator=data & 0xff, denominator=1 << (data >> 8 & 0xff),
+                       clocks_per_click=data >> 16 & 0xff, notated_32nd_notes_per_beat=data >> 24 & 0xff, time=time)
+
+
+# returns the event row values of a mido message, appending it to extras
+# if it is stored as OTHER
+def message_row(msg, extras):
+    code = TYPE_CODES.get(msg.type, OTHER)
+    channel = getattr(msg, 'channel', -1)
+    note = velocity = program = -1
+    data = 0
+    if code == NOTE_ON or code == NOTE_OFF:
+        note = msg.note
+        velocity = msg.velocity
+    elif code == PROGRAM_CHANGE:
+        program = msg.program
+    elif code == SET_TEMPO:
+        data = msg.tempo
+    elif code == KEY_SIGNATURE:
+        data = KEY_INDEX.get(msg.key, -1)
+        if data < 0:
+            code = OTHER
+    elif code == TIME_SIGNATURE:
+        data = pack_time_signature(msg)
+        if data is None:
+            code = OTHER
+    if code == OTHER:
+        data = len(extras)
+        extras.append(msg)
+    return (code, channel, note, velocity, program, data, msg.time, 0, 0.0)
+
+
+# converts a MidiTrack to an event array, appending unsupported messages to extras
+def track_to_array(track, extras):
+    rows = np.array([message_row(msg, extras) for msg in track], dtype=EVENT_DTYPE)
+    rows['tick'] = np.cumsum(rows['delta'])
+    return rows
+
+
+# returns an event array holding one row, for messages added to a track
+def make_row(code, channel=-1, note=-1, velocity=-1, program=-1, data=0, delta=0):
+    return np.array([(code, channel, note, velocity, program, data, delta, 0, 0.0)],
+                    dtype=EVENT_DTYPE)
+
+
+# converts an event array back to a MidiTrack
+def array_to_track(rows, extras):
+    track = MidiTrack()
+    for row in rows.tolist():
+        code, channel, note, velocity, program, data, delta = row[:7]
+        if code == NOTE_ON:
+            msg = Message('note_on', channel=channel, note=note, velocity=velocity, time=delta)
+        elif code == NOTE_OFF:
+            msg = Message('note_off', channel=channel, note=note, velocity=velocity, time=delta)
+        elif code == PROGRAM_CHANGE:
+            msg = Message('program_change', channel=channel, program=program, time=delta)
+        elif code == SET_TEMPO:
+            msg = MetaMessage('set_tempo', tempo=data, time=delta)
+        elif code == TIME_SIGNATURE:
+            msg = unpack_time_signature(data, delta)
+        elif code == KEY_SIGNATURE:
+            msg = MetaMessage('key_signature', key=KEY_NAMES[data], time=delta)
+        elif code == END_OF_TRACK:
+            msg = MetaMessage('end_of_track', time=delta)
+        else:
+            msg = extras[data].copy(time=delta)
+        track.append(msg)
+    return track
+
+
+# builds a tempo map from every set_tempo event in a list of event arrays,
+# returns arrays of segment start ticks, segment start seconds and tempos
+def tempo_map(tracks, ticks_per_beat):
+    tempo_rows = [rows[rows['type'] == SET_TEMPO] for rows in tracks]
+    ticks = np.concatenate([[0]] + [rows['tick'] for rows in tempo_rows])
+    tempos = np.concatenate([[DEFAULT_TEMPO]] + [rows['data'] for rows in tempo_rows])
+    # tempo changes in later tracks win ties, as when mido merges tracks
+    order = np.argsort(ticks, kind='stable')
+    ticks = ticks[order]
+    tempos = tempos[order]
+    seconds = np.zeros(len(ticks))
+    seconds[1:] = np.cumsum(np.diff(ticks) * (tempos[:-1] * 1e-6 / ticks_per_beat))
+    return ticks, seconds, tempos
+
+
+# converts absolute ticks to absolute seconds using a tempo map
+def ticks_to_seconds(ticks, tmap, ticks_per_beat):
+    seg_ticks, seg_seconds, seg_tempos = tmap
+    seg = np.searchsorted(seg_ticks, ticks, side='right') - 1
+    # same arithmetic as mido.tick2second within each segment
+    return seg_seconds[seg] + (ticks - seg_ticks[seg]) * (seg_tempos[seg] * 1e-6 / ticks_per_beat)
+
+
+# returns playback time in seconds of a list of event arrays, as
+# MidiFile.length gives for the same messages. The tracks are merged in time
+# order, end_of_track events only count at the end, and each time delta is
+# converted at the tempo set before it, adding the same floats in the same
+# order as mido
+def length(tracks, ticks_per_beat):
+    if not sum(len(rows) for rows in tracks):
+        return 0
+    ticks = np.concatenate([np.cumsum(rows['delta']) for rows in tracks])
+    codes = np.concatenate([rows['type'] for rows in tracks])
+    data = np.concatenate([rows['data'] for rows in tracks])
+    order = np.argsort(ticks, kind='stable')
+    ticks = ticks[order]
+    keep = codes[order] != END_OF_TRACK
+    kept_ticks = ticks[keep]
+    is_tempo = codes[order][keep] == SET_TEMPO
+    tempos = data[order][keep]
+
+    # time delta of each message, then of the end_of_track message added
+    # after the last, which takes the time of any removed before it
+    deltas = np.append(np.diff(kept_ticks, prepend=0),
+                       ticks[-1] - (kept_ticks[-1] if len(kept_ticks) else 0))
+    # index of the last set_tempo message before each message, -1 picking
+    # the default tempo appended after them
+    last = np.maximum.accumulate(np.where(is_tempo, np.arange(len(kept_ticks)), -1))
+    before = np.concatenate([[-1], last])
+    delta_tempos = np.append(tempos, DEFAULT_TEMPO)[before]
+    moving = deltas > 0
+    seconds = deltas[moving] * (delta_tempos[moving] * 1e-6 / ticks_per_beat)
+    return sum(seconds.tolist())
+
+
+# a MIDI file held as one structured event array per track
+class EventTable:
+
+    def __init__(self, tracks, ticks_per_beat, extras=None, type=1):
+        self.tracks = tracks
+        self.ticks_per_beat = ticks_per_beat
+        self.extras = extras if extras is not None else []
+        self.type = type
+        # values derived from the events, kept by cache.fact
+        self.facts = {}
+        self.update_seconds()
+
+    # recomputes the absolute seconds column of every track from the tempo map
+    def update_seconds(self):
+        tmap = tempo_map(self.tracks, self.ticks_per_beat)
+        for rows in self.tracks:
+            rows['seconds'] = ticks_to_seconds(rows['tick'], tmap, self.ticks_per_beat)
+
+    # returns new MidiFile holding the same messages
+    def to_midifile(self):
+        mid = MidiFile(type=self.type, ticks_per_beat=self.ticks_per_beat)
+        for rows in self.tracks:
+            mid.tracks.append(array_to_track(rows, self.extras))
+        return mid
+
+    def save(self, filepath):
+        self.to_midifile().save(filepath)
+
+
+# converts MidiFile to EventTable
+def from_midifile(mid):
+    extras = []
+    tracks = [track_to_array(track, extras) for track in mid.tracks]
+    return EventTable(tracks, mid.ticks_per_beat, extras, mid.type)
+
+
+# loads file path as EventTable
+def load(filepath):
+    if pack.is_member(filepath):
+        return from_midifile(MidiFile(file=io.BytesIO(pack.read(filepath))))
+    return from_midifile(MidiFile(filepath))
+
+
+# returns number of note_on events in an event array
+def count_note_on(rows):
+    return int(np.count_nonzero(rows['type'] == NOTE_ON))
+
+
+# check if track contains any note on messages
+def has_note_on(rows):
+    return bool(np.any(rows['type'] == NOTE_ON))
+
+
+# check if track contains any message on the drum channel
+def is_drum(rows):
+    return bool(np.any(rows['channel'] == 9))
+
+
+# returns true if the tracks hold more than one note_on event
+def is_valid(tracks):
+    return sum(count_note_on(rows) for rows in tracks) > 1
+
+
+# returns the row of the first event of each track matching mask_fn,
+# taken from the last track that has one, or None if no track matches
+def last_track_first(tracks, mask_fn):
+    found = None
+    for rows in tracks:
+        hits = np.flatnonzero(mask_fn(rows))
+        if len(hits):
+            found = rows[hits[0]]
+    return found
+
+
+# returns tempo of the first set_tempo event of the last track that has one
+def find_tempo(tracks):
+    row = last_track_first(tracks, lambda rows: rows['type'] == SET_TEMPO)
+    return None if row is None else int(row['data'])
+
+
+# returns channel of the first channel message of the last track that has one
+def find_channel(tracks):
+    row = last_track_first(tracks, lambda rows: rows['channel'] >= 0)
+    return None if row is None else int(row['channel'])
+
+
+# returns program and channel of the first program_change event of the last
+# track that has one, or None
+def find_program_change(tracks):
+    row = last_track_first(tracks, lambda rows: rows['type'] == PROGRAM_CHANGE)
+    return None if row is None else (int(row['program']), int(row['channel']))
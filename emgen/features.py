@@ -0,0 +1,237 @@
+import io
+import os
+import argparse
+import numpy as np
+from mido import MidiFile
+from . import events
+from . import smf
+from . import shards
+from . import pack
+from . import metadata
+from . import metrics
+from . import runner
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will compute features of the music of every word and tile in the metadata index of an output directory of emgen word, emgen tile or emgen pipeline: tempo, key and mode, pitch range and register, note density, velocity and articulation. They are stored in the features table of the index, joined to its items by path'
+)
+parser.add_argument('-i', '--input', default=os.getcwd(),
+                    help="Path to output directory of emgen word, emgen tile or emgen pipeline. (Defaults to current working directory if not specified)")
+parser.add_argument('-bs', '--batch_size', default=4096, type=int,
+                    help="Number of words and tiles each worker reads and computes features of together. (Defaults to 4096 if not specified)")
+parser.add_argument('-f', '--force', action='store_true',
+                    help="Compute features of every word and tile again. (Only those without features computed if not specified)")
+runner.add_arguments(parser)
+
+# Krumhansl-Kessler key profiles, the weight of each pitch class above the
+# tonic in major and minor keys
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+# key names, as in events.KEY_NAMES, of the major then minor key on each
+# tonic pitch class from C
+PROFILE_KEYS = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B',
+                'Cm', 'C#m', 'Dm', 'Ebm', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'Bbm', 'Bm']
+
+# bits of the tick in the combined (segment, tick) key of each note onset
+TICK_BITS = 40
+
+
+# returns the 24 key profiles rotated to each tonic, centred and scaled to
+# unit length, so a product with a centred histogram is their correlation
+def key_profiles():
+    profiles = np.array([np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)] +
+                        [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)])
+    profiles -= profiles.mean(axis=1, keepdims=True)
+    return profiles / np.linalg.norm(profiles, axis=1, keepdims=True)
+
+
+PROFILES = key_profiles()
+
+
+# returns index into PROFILE_KEYS of the key best correlated with each row of
+# pitch class histograms, -1 for rows without notes or with every class equal
+def estimate_keys(histograms):
+    centred = histograms - histograms.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centred, axis=1)
+    correlation = centred @ PROFILES.T
+    keys = correlation.argmax(axis=1)
+    keys[norms == 0] = -1
+    return keys
+
+
+# returns dict of arrays of the note features of count segments of event
+# rows, segment holding the index of the word or tile of each row. Computed
+# for every segment at once: note count, lowest and highest note, register
+# (mean note), mean and variance of velocity, estimated key, and articulation,
+# the mean note length over the mean time between onsets (near 1 or above
+# legato, below 0.5 staccato). Segments without notes get NaN or -1
+def note_features(rows, segment, count):
+    kind = rows['type']
+    note = rows['note'].astype(np.int64)
+    tick = rows['tick'].astype(np.int64)
+    on = (kind == events.NOTE_ON) & (rows['velocity'] > 0)
+    sounding = (kind == events.NOTE_ON) | (kind == events.NOTE_OFF)
+
+    on_segment = segment[on]
+    on_note = note[on]
+    on_velocity = rows['velocity'][on].astype(np.float64)
+    note_count = np.bincount(on_segment, minlength=count)
+    played = np.where(note_count > 0, note_count, np.nan)
+
+    lowest = np.full(count, 128, dtype=np.int64)
+    np.minimum.at(lowest, on_segment, on_note)
+    highest = np.full(count, -1, dtype=np.int64)
+    np.maximum.at(highest, on_segment, on_note)
+    velocity_mean = np.bincount(on_segment, on_velocity, count) / played
+    velocity_variance = np.bincount(on_segment, on_velocity ** 2, count) / played - velocity_mean ** 2
+
+    histograms = np.bincount(on_segment * 12 + on_note % 12,
+                             minlength=count * 12).reshape(count, 12).astype(np.float64)
+
+    # each note on is ended by the next message of the same segment, channel
+    # and note, if that is a note off or a note on of velocity 0
+    order = np.flatnonzero(sounding)
+    order = order[np.lexsort((tick[order], note[order], rows['channel'][order], segment[order]))]
+    same = ((segment[order][1:] == segment[order][:-1]) &
+            (rows['channel'][order][1:] == rows['channel'][order][:-1]) &
+            (note[order][1:] == note[order][:-1]))
+    paired = same & on[order][:-1] & ~on[order][1:]
+    durations = (tick[order][1:] - tick[order][:-1])[paired]
+    pair_segment = segment[order][:-1][paired]
+    pairs = np.bincount(pair_segment, minlength=count)
+    mean_duration = np.bincount(pair_segment, durations, count) / np.where(pairs > 0, pairs, np.nan)
+
+    # mean time between distinct onsets, from the first and last onset of
+    # each segment, found in the onsets sorted by segment then tick
+    onsets = np.unique(on_segment << TICK_BITS | tick[on])
+    onset_segment = onsets >> TICK_BITS
+    onset_tick = np.append(onsets & ((1 << TICK_BITS) - 1), 0)
+    first = np.searchsorted(onset_segment, np.arange(count))
+    last = np.searchsorted(onset_segment, np.arange(count), 'right') - 1
+    gaps = last - first
+    mean_gap = (onset_tick[last] - onset_tick[first]) / np.where(gaps > 0, gaps, np.nan)
+    articulation = mean_duration / np.where(mean_gap > 0, mean_gap, np.nan)
+
+    return {'note_count': note_count, 'lowest_note': lowest, 'highest_note': highest,
+            'register': np.bincount(on_segment, on_note, count) / played,
+            'velocity_mean': velocity_mean, 'velocity_variance': velocity_variance,
+            'key': estimate_keys(histograms), 'articulation': articulation}
+
+
+# shard readers opened by this process, by shard path
+readers = {}
+
+
+# returns event arrays of the tracks of a word or tile saved to a file or
+# packed into a shard. Decoded straight from the SMF data without the seconds
+# column of an EventTable, which no feature needs. Data this reader does not
+# handle is read by mido
+def load(path):
+    if shards.is_packed(path):
+        shard_path, key, filepath = path.split(shards.SEPARATOR, 2)
+        if shard_path not in readers:
+            readers[shard_path] = shards.ShardReader(shard_path)
+        offset, wavelength = key.split('_')
+        data = readers[shard_path].read(filepath, int(offset), int(wavelength))
+    else:
+        data = pack.read(path)
+    header = smf.read_header(data)
+    if header is not None:
+        extras = []
+        tracks = [smf.decode_track(data, start, end, extras) for start, end in header[2]]
+        if all(rows is not None for rows in tracks):
+            return tracks
+    return events.from_midifile(MidiFile(file=io.BytesIO(data))).tracks
+
+
+# returns the data of the first row of a message type in each of count
+# segments of event rows, default for segments without one
+def first_values(rows, segment, kind, count, default):
+    found = rows['type'] == kind
+    segments, first = np.unique(segment[found], return_index=True)
+    values = np.full(count, default, dtype=np.int64)
+    values[segments] = rows['data'][found][first]
+    return values
+
+
+# returns list of the values of an array, None in place of NaN and of those
+# not kept
+def column(array, kept=None):
+    if kept is None:
+        kept = ~np.isnan(array)
+    return [value if keep else None for value, keep in zip(array.tolist(), kept.tolist())]
+
+
+# returns rows of FEATURE_COLUMNS values for a batch of (path, length in
+# seconds) of words and tiles. Each is read alone, then the features of all
+# of them are computed together from their concatenated header and music
+# tracks. The key is that of the first key_signature message, or estimated
+# from the notes if there is none
+def measure(batch):
+    paths, lengths, headers, music = [], [], [], []
+    for path, length in batch:
+        try:
+            with metrics.timed('parse'):
+                tracks = load(path)
+        except Exception:
+            metrics.count('items_errored')
+            print('Features not computed for: %s' % path)
+            continue
+        paths.append(path)
+        lengths.append(length or 0)
+        headers.append(tracks[0])
+        music.append(tracks[1:])
+    count = len(paths)
+    if count == 0:
+        return []
+
+    header_rows = np.concatenate(headers)
+    header_segment = np.repeat(np.arange(count), [len(rows) for rows in headers])
+    rows = np.concatenate([rows for tracks in music for rows in tracks])
+    segment = np.repeat(np.arange(count), [sum(len(rows) for rows in tracks) for tracks in music])
+    found = note_features(rows, segment, count)
+    tempo = first_values(header_rows, header_segment, events.SET_TEMPO, count, events.DEFAULT_TEMPO)
+    signature = first_values(header_rows, header_segment, events.KEY_SIGNATURE, count, -1)
+    metrics.count('items_processed', count)
+    metrics.count('messages_processed', len(rows))
+
+    keys = [events.KEY_NAMES[index] if index >= 0 else PROFILE_KEYS[estimate] if estimate >= 0 else None
+            for index, estimate in zip(signature.tolist(), found['key'].tolist())]
+    modes = [None if key is None else 'minor' if key.endswith('m') else 'major' for key in keys]
+    played = found['note_count'] > 0
+    lengths = np.array(lengths, dtype=np.float64)
+    density = found['note_count'] / np.where(lengths > 0, lengths, np.nan)
+    return list(zip(
+        paths, (60000000 / tempo).tolist(), keys, modes, (signature < 0).astype(int).tolist(),
+        found['note_count'].tolist(), column(found['lowest_note'], played),
+        column(found['highest_note'], played),
+        column(found['highest_note'] - found['lowest_note'], played), column(found['register']),
+        column(density), column(found['velocity_mean']), column(found['velocity_variance']),
+        column(found['articulation'])))
+
+
+# splits the words and tiles to measure into batches, one task each
+def batches(items, size):
+    return [items[start:start+size] for start in range(0, len(items), size)]
+
+
+# computes features of every word and tile in the index without them, in
+# batches spread across worker processes, storing each batch as it is done
+def main(argv=None):
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    output_dir = params['input']
+    index_path = metadata.index_path(output_dir)
+    items = metadata.unmeasured(index_path, params['force'])
+    errors = []
+    for batch, rows in runner.run(measure, batches(items, params['batch_size']),
+                                  params['jobs'], errors, stage='features', unit='batches'):
+        with metrics.timed('write'):
+            metadata.replace_features(index_path, rows)
+    runner.report_errors(errors, output_dir, 'features')
+    metrics.report(output_dir, 'features')
+
+
+if __name__ == '__main__':
+    main()
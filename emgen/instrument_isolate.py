@@ -0,0 +1,201 @@
+import os
+from pathlib import Path
+import argparse
+from . import events
+from . import runner
+from . import pack
+from . import manifest
+from . import metrics
+from . import cache
+from . import smf
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take a folder of MIDI files, isolate instrument parts contained in each file, and save to new files within separate instrument directories. Make sure data is passed through emgen type1 first to ensure input set is all SMF Type 1'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+parser.add_argument('-mp', '--multi_pass', action='store_true',
+                    help="Use the original isolation that re-reads each file once per GM program, for comparing output with earlier runs. (Single pass if not specified)")
+runner.add_arguments(parser)
+runner.add_shard_arguments(parser)
+cache.add_arguments(parser)
+manifest.add_arguments(parser)
+
+
+# stores stage arguments as module variables. Takes dict of argument values,
+# parser defaults are used for any not given
+def configure(params):
+    global output_dir
+    output_dir = runner.argument(parser, params, 'output')
+    cache.configure(runner.argument(parser, params, 'cache_dir'))
+
+
+configure({})
+
+
+# Checks if a MIDI track is for drums.
+# Takes a track event array as an argument, returns true if drums present.
+def is_drum(track):
+    return events.is_drum(track)
+
+
+# Removes all drum tracks from a passed EventTable.
+# Returns new EventTable object without them.
+def without_drums(table):
+    tracks = [track for track in table.tracks if not is_drum(track)]
+    return events.EventTable(tracks, table.ticks_per_beat, table.extras, table.type)
+
+
+# Removes all drum tracks from a passed file.
+# Takes a file path as argument and returns EventTable object.
+def remove_drums(filepath):
+    return without_drums(cache.load(filepath))
+
+
+# Checks validity of EventTable object.
+# Takes EventTable as argument and returns true if more than one
+# note_on message is contained, returns false otherwise.
+def is_valid(table):
+    return events.is_valid(table.tracks)
+
+
+# returns the program numbers of all program_change messages in a track
+def program_changes(track):
+    return track['program'][track['type'] == events.PROGRAM_CHANGE].tolist()
+
+
+# Identifies all instruments tracks present in a drum-free EventTable in a
+# single pass, grouping tracks by their first program_change. Tracks without a
+# program_change are kept in every group. Yields (program, EventTable) pairs
+def separate(table):
+    header, tracks = table.tracks[:1], table.tracks[1:]
+
+    groups = {}
+    for track in tracks:
+        programs = program_changes(track)
+        groups.setdefault(programs[0] if programs else None, []).append(track)
+    shared = groups.pop(None, [])
+
+    for program in sorted(groups):
+        # keep tracks in their original order
+        keep = [track for track in tracks
+                if any(track is kept for kept in groups[program] + shared)]
+        yield program, events.EventTable(header + keep, table.ticks_per_beat, table.extras, table.type)
+
+
+# Identifies all instruments tracks present in passed file in a single pass,
+# and create new files for each single instrument. Takes file path
+# as argument, saves new file for each instrument found and returns their paths.
+def isolate_all(filepath):
+    instruments = runner.load_instruments()
+    outputs = []
+    file_name = os.path.basename(filepath)
+    with metrics.timed('parse'):
+        table = cache.load(filepath)
+    metrics.count('messages_processed', sum(len(rows) for rows in table.tracks))
+    for program, table in separate(without_drums(table)):
+        # create new directory to store new file,
+        # using matching program number to name folder
+        new_dir = output_dir+'/source_separated/'+instruments[program]+'/'
+        Path(new_dir).mkdir(parents=True, exist_ok=True)
+
+        # validate file before saving
+        with metrics.timed('validate'):
+            valid = is_valid(table)
+        if valid:
+            with metrics.timed('write'):
+                smf.save(table, new_dir+file_name)
+            outputs.append(new_dir+file_name)
+            metrics.count('parts_saved')
+        else:
+            print('Invalid file not saved: %s – %s' %
+                  (filepath, instruments[program]))
+            metrics.count('parts_invalid')
+    return outputs
+
+
+# Original isolation, re-reading the file for every program number.
+# Identifies all instruments tracks present in passed file,
+# and create new files for each single instrument. Takes file path
+# as argument, saves new file for each instrument track found and returns their paths.
+def isolate_all_multi_pass(filepath):
+    instruments = runner.load_instruments()
+    outputs = []
+
+    # every instrument track has a program number in the range 0-127
+    for i in range(0, 128):
+        # pass file through remove_drums and store as local EventTable obj
+        mid = remove_drums(filepath)
+        # iterate through each track beyond 0th, to search for first
+        # program_change number to see if matches current i value
+        for track in mid.tracks[1:]:
+            for inst_num in program_changes(track):
+                # if no match, increment i
+                if inst_num != i:
+                    break
+                # if match, iterate through EventTable obj again and remove tracks that do not match
+                else:
+                    for track in mid.tracks[1:]:
+                        for inst_match in program_changes(track):
+                            if (inst_num != inst_match):
+                                remaining = [j for j, kept in enumerate(
+                                    mid.tracks) if kept is track]
+                                if not remaining:
+                                    continue
+                                del mid.tracks[remaining[0]]
+
+                                # create new directory to store new file,
+                                # using matching program number to name folder
+                                new_dir = output_dir + \
+                                    '/source_separated/' + \
+                                    instruments[i]+'/'
+                                Path(new_dir).mkdir(
+                                    parents=True, exist_ok=True)
+                                file_name = os.path.basename(
+                                    filepath)
+
+                                # validate file before saving
+                                if is_valid(mid):
+                                    mid.save(new_dir+file_name)
+                                    if new_dir+file_name not in outputs:
+                                        outputs.append(new_dir+file_name)
+                                else:
+                                    print(
+                                        'Invalid file not saved: %s – %s' % (filepath, instruments[i]))
+    return outputs
+
+
+# add all file paths to list, pass each file through isolate_all()
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    configure(params)
+    input_dir = params['input']
+    jobs = params['jobs']
+    stage = runner.shard_name('instrument_isolate', params['shard'])
+    multi_pass = params['multi_pass']
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    newlist = pack.files(input_dir)
+    newlist = runner.shard_files(newlist, input_dir, params['shard'])
+    stage_params = {'multi_pass': params['multi_pass']}
+    stage_manifest = manifest.Manifest(
+        output_dir+'/%s.jsonl' % runner.shard_name('source_separated_manifest', params['shard']), stage_params)
+    todo = stage_manifest.pending(newlist, params['force'])
+    errors = []
+    for file, outputs in runner.run(isolate_all_multi_pass if multi_pass else isolate_all,
+                                    todo, jobs, errors,
+                                    initializer=configure, initargs=(params,),
+                                    stage=stage):
+        stage_manifest.record(file, outputs)
+    stage_manifest.close()
+    runner.report_errors(errors, output_dir, stage)
+    metrics.report(output_dir, stage)
+
+
+if __name__ == '__main__':
+    main()
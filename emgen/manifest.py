@@ -0,0 +1,133 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from . import shards
+from . import pack
+from . import metrics
+
+
+# adds the --force argument shared by every stage to an argument parser
+def add_arguments(parser):
+    parser.add_argument('-f', '--force', action='store_true',
+                        help="Process every file again, even if unchanged since the last run recorded in the stage manifest. (Unchanged files skipped if not specified)")
+
+
+# returns hex digest of the content of file passed as parameter
+def content_hash(filepath):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# removes output files listed in a manifest entry, ignoring any already gone.
+# Outputs packed into a shard are marked as removed in the shard index
+def remove_outputs(entry):
+    for output in entry.get('outputs', []):
+        if shards.is_packed(output):
+            shards.remove(output)
+            continue
+        try:
+            os.remove(output)
+        except FileNotFoundError:
+            pass
+
+
+# returns the entries of the manifest at path by input file, empty if it does
+# not exist
+def read(path):
+    entries = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line of a run that was interrupted while writing
+                    continue
+                entries[entry['file']] = entry
+    return entries
+
+
+# writes manifest entries to path, one line per input file, replacing it
+# only once every line is written
+def write(path, entries):
+    with open(path+'.tmp', 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry)+'\n')
+    os.replace(path+'.tmp', path)
+
+
+# Record of the inputs a stage has processed, stored as JSON lines at path.
+# Each entry maps an input file, its size, mtime and content hash, and the
+# stage parameters to the output files produced from it. Entries are appended
+# as each file completes, so an interrupted run resumes where it stopped
+class Manifest:
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.entries = read(path)
+        self.current = {}
+        self.log = None
+
+    # returns (size, mtime, hash) of file, reusing the recorded hash when the
+    # size and mtime have not changed since. Files within a packed corpus
+    # carry the hash recorded when packed
+    def stat(self, filepath):
+        if pack.is_member(filepath):
+            return pack.stat(filepath)
+        st = os.stat(filepath)
+        entry = self.entries.get(filepath)
+        if entry is not None and entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime:
+            return st.st_size, st.st_mtime, entry['hash']
+        return st.st_size, st.st_mtime, content_hash(filepath)
+
+    # returns list of files that need processing. Files unchanged since their
+    # entry was recorded with the same parameters are skipped, unless
+    # dependents, given the files that changed, returns them as needing to be
+    # processed again too. All others have the outputs of their previous
+    # entry removed
+    def pending(self, files, force=False, threads=16, dependents=None):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            stats = list(pool.map(self.stat, files))
+        todo = []
+        for filepath, (size, mtime, digest) in zip(files, stats):
+            self.current[filepath] = (size, mtime, digest)
+            entry = self.entries.get(filepath)
+            if entry is not None and not force and entry.get('hash') == digest and entry.get('params') == self.params:
+                # a touched but unchanged file is not hashed again next run
+                entry['size'], entry['mtime'] = size, mtime
+                continue
+            todo.append(filepath)
+        if dependents is not None and todo and len(todo) < len(files):
+            changed = set(todo) | set(dependents(todo))
+            todo = [filepath for filepath in files if filepath in changed]
+        if len(todo) < len(files):
+            metrics.count('files_skipped', len(files) - len(todo))
+        for filepath in todo:
+            entry = self.entries.pop(filepath, None)
+            if entry is not None:
+                remove_outputs(entry)
+        return todo
+
+    # records outputs produced from an input file, with any extra fields
+    def record(self, filepath, outputs, **fields):
+        size, mtime, digest = self.current.get(filepath) or self.stat(filepath)
+        entry = {'file': filepath, 'size': size, 'mtime': mtime, 'hash': digest,
+                 'params': self.params, 'outputs': outputs}
+        entry.update(fields)
+        self.entries[filepath] = entry
+        if self.log is None:
+            self.log = open(self.path, 'a')
+        self.log.write(json.dumps(entry)+'\n')
+        self.log.flush()
+
+    # rewrites the manifest with one line per input file
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        write(self.path, self.entries.values())
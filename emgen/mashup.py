@@ -0,0 +1,229 @@
+import os
+import struct
+import argparse
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from . import runner
+from . import shards
+from . import metadata
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take the words or tiles saved by emgen word, emgen tile or emgen pipeline, find pairs from different source files with the same key signature and a similar tempo and length in their metadata index, and save each pair as a new file holding the first with the music track of the second added'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to output directory of emgen word, emgen tile or emgen pipeline holding metadata.sqlite, or to its words or tiles folder. (Required)")
+parser.add_argument('-k', '--kind', default=None, choices=['word', 'tile'],
+                    help="Pair only words or only tiles. (Both if not specified, or the kind of the folder if -i is a words or tiles folder)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+parser.add_argument('-bt', '--bpm_tolerance', default=1, type=float,
+                    help="Pairs must be less than this many beats per minute apart. (Defaults to 1 if not specified)")
+parser.add_argument('-lt', '--length_tolerance', default=1, type=float,
+                    help="Pairs must be less than this many seconds apart in length. (Defaults to 1 if not specified)")
+parser.add_argument('-pl', '--pair_limit', default=None, type=int,
+                    help="Upper boundary of number of pairs saved. (No limit applied if not specified)")
+runner.add_arguments(parser)
+
+
+# stores arguments as module variables. Takes dict of argument values,
+# parser defaults are used for any not given
+def configure(params):
+    global output_dir, bpm_tolerance, length_tolerance
+    output_dir = runner.argument(parser, params, 'output')
+    bpm_tolerance = runner.argument(parser, params, 'bpm_tolerance')
+    length_tolerance = runner.argument(parser, params, 'length_tolerance')
+
+
+configure({})
+
+
+# returns (index path, kind) for the input directory, either an output
+# directory holding the metadata index or its words or tiles folder, which
+# selects that kind unless one is given
+def locate(input_dir, kind):
+    input_dir = os.path.normpath(input_dir)
+    folders = {'words': 'word', 'tiles': 'tile'}
+    index_path = metadata.index_path(input_dir)
+    if not os.path.isfile(index_path) and os.path.basename(input_dir) in folders:
+        index_path = metadata.index_path(os.path.dirname(input_dir))
+        kind = kind or folders[os.path.basename(input_dir)]
+    if not os.path.isfile(index_path):
+        raise SystemExit('mashup: no metadata index for %s, run emgen word, emgen tile or emgen pipeline first'
+                         % input_dir)
+    return index_path, kind
+
+
+# returns candidate dict of the path, source name, key, tempo in beats per
+# minute and length of an index row, or None if its source file had no
+# set_tempo or key_signature message in its header track. The source name
+# is shared by every instrument part cleaned from the same file
+def candidate(row):
+    if row['bpm'] is None or row['key'] is None:
+        print('No set_tempo or key_signature message, not matched: %s' % row['path'])
+        return None
+    return {'path': row['path'], 'source': os.path.basename(row['file'])[:-4], 'key': row['key'],
+            'bpm': row['bpm'], 'length': row['length_seconds'],
+            'name': file_name(row)}
+
+
+# returns file name of a word or tile, as saved or as it would have been if
+# it was packed in a shard
+def file_name(row):
+    if not shards.is_packed(row['path']):
+        return os.path.basename(row['path'])
+    return '%s_%s_%d_%d.mid' % (os.path.basename(row['file'])[:-4], row['instrument_name'],
+                                row['offset'], row['wavelength'])
+
+
+# shard readers of packed words and tiles by shard path, set by open_readers
+readers = {}
+
+
+# opens a reader for every shard in the folders of packed candidates
+def open_readers(candidates):
+    for directory in sorted({os.path.dirname(c['path'].split(shards.SEPARATOR)[0])
+                             for c in candidates if shards.is_packed(c['path'])}):
+        for reader in shards.open_shards(directory).values():
+            readers[os.path.normpath(reader.path)] = reader
+
+
+# returns the SMF bytes of a word or tile, from its file or packed shard
+def read(path):
+    if shards.is_packed(path):
+        shard_path, key, filepath = path.split(shards.SEPARATOR, 2)
+        offset, wavelength = key.split('_')
+        return bytes(readers[os.path.normpath(shard_path)].read(filepath, int(offset), int(wavelength)))
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# candidates grouped by key signature, each list sorted by tempo then length.
+# Set in each worker by set_buckets
+buckets = {}
+
+# number of first files of a pair searched by each task
+TASK_SIZE = 256
+
+
+# stores arguments and candidate buckets as module variables in each worker
+def set_buckets(params, new_buckets):
+    global buckets
+    configure(params)
+    buckets = new_buckets
+
+
+# returns dict of key signature to list of candidates sorted by tempo and length
+def group(candidates):
+    grouped = defaultdict(list)
+    for candidate in candidates:
+        grouped[candidate['key']].append(candidate)
+    for members in grouped.values():
+        members.sort(key=lambda c: (c['bpm'], c['length'], c['path']))
+    return dict(grouped)
+
+
+# returns list of (key, start, stop) tasks covering every bucket, so large
+# buckets are spread across workers
+def tasks(grouped):
+    return [(key, start, min(start + TASK_SIZE, len(grouped[key])))
+            for key in sorted(grouped)
+            for start in range(0, len(grouped[key]), TASK_SIZE)]
+
+
+# returns list of (first, second) path pairs whose first file is in a slice
+# of a key signature bucket, passed as a (key, start, stop) task. Candidates
+# within the tempo window are found by bisecting the sorted tempos, then
+# filtered by length and source file together
+def find_pairs(task):
+    key, task_start, task_stop = task
+    members = buckets[key]
+    bpms = [c['bpm'] for c in members]
+    lengths = np.array([c['length'] for c in members])
+    sources = np.array([c['source'] for c in members])
+    pairs = []
+    for first in members[task_start:task_stop]:
+        start = bisect_right(bpms, first['bpm'] - bpm_tolerance)
+        stop = bisect_left(bpms, first['bpm'] + bpm_tolerance)
+        window = np.arange(start, stop)
+        window = window[(np.abs(lengths[start:stop] - first['length']) < length_tolerance) &
+                        (sources[start:stop] != first['source'])]
+        pairs.extend(((first['path'], first['name']), (members[j]['path'], members[j]['name']))
+                     for j in window.tolist())
+    return pairs
+
+
+# returns list of (start, end) byte ranges of the track chunks of SMF data
+def track_chunks(data):
+    pos = 8 + struct.unpack('>I', data[4:8])[0]
+    chunks = []
+    while pos + 8 <= len(data):
+        size = struct.unpack('>I', data[pos+4:pos+8])[0]
+        chunks.append((pos, pos+8+size))
+        pos += 8+size
+    return chunks
+
+
+# saves the first word or tile of a pair with the music track of the second
+# added, splicing the track chunk rather than parsing either again. Each is
+# given as (path, file name). Returns path of the saved file
+def save_pair(pair):
+    (first, first_name), (second, second_name) = pair
+    first_data = read(first)
+    second_data = read(second)
+    first_chunks = track_chunks(first_data)
+    start, end = track_chunks(second_data)[1]
+    header_end = first_chunks[0][0] if first_chunks else len(first_data)
+    new_path = output_dir+'/mashups/%s_+_%s' % (first_name[:-4], second_name)
+    with open(new_path, 'wb') as f:
+        f.write(first_data[:10])
+        f.write(struct.pack('>H', len(first_chunks) + 1))
+        f.write(first_data[12:header_end])
+        for chunk_start, chunk_end in first_chunks:
+            f.write(first_data[chunk_start:chunk_end])
+        f.write(second_data[start:end])
+    return new_path
+
+
+# select the words and tiles from the metadata index, then find and save pairs
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    configure(params)
+    jobs = params['jobs']
+    pair_limit = params['pair_limit']
+    index_path, kind = locate(params['input'], params['kind'])
+    Path(output_dir+'/mashups/').mkdir(parents=True, exist_ok=True)
+
+    errors = []
+    candidates = [found for found in map(candidate, metadata.query(index_path, kind))
+                  if found is not None]
+    open_readers(candidates)
+
+    # find pairs within each key signature bucket in parallel
+    grouped = group(candidates)
+    set_buckets(params, grouped)
+    pairs = []
+    for task, task_pairs in runner.run(find_pairs, tasks(grouped), jobs, errors,
+                                       initializer=set_buckets, initargs=(params, grouped)):
+        pairs.extend(task_pairs)
+        if pair_limit is not None and len(pairs) >= pair_limit:
+            break
+    if pair_limit is not None:
+        pairs = pairs[:pair_limit]
+
+    # saving is bound by file reads and writes, so threads are used
+    saved = [new_path for pair, new_path in runner.run(
+        save_pair, pairs, jobs, errors, executor=ThreadPoolExecutor)]
+    print('%d pairs saved to %s' % (len(saved), output_dir+'/mashups/'))
+    runner.report_errors(errors, output_dir, 'mashup')
+    for reader in readers.values():
+        reader.close()
+    readers.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import os
+import re
+import argparse
+from . import manifest
+from . import metadata
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will combine the manifests and metadata indexes written by every shard of a run with --shard into those of one run over the whole input, so later runs without --shard and emgen query see the whole corpus. Run once every shard has finished, on the output directory the shards wrote to or were copied into'
+)
+parser.add_argument('-i', '--input', default=os.getcwd(),
+                    help="Path to output directory of the shards. (Defaults to current working directory if not specified)")
+
+# manifest or metadata index written by one shard, e.g. tiles_manifest.0-of-4.jsonl
+SHARD_FILE = re.compile(r'^(.+_manifest|metadata)\.(\d+)-of-(\d+)\.(jsonl|sqlite)$')
+
+
+# returns dict of the shard files in a directory, mapping each merged file
+# name to {shard count: {shard: path}}
+def find_shards(directory):
+    found = {}
+    for name in sorted(os.listdir(directory)):
+        match = SHARD_FILE.match(name)
+        if match is None:
+            continue
+        base, index, count, extension = match.groups()
+        merged = found.setdefault(base+'.'+extension, {})
+        merged.setdefault(int(count), {})[int(index)] = directory+'/'+name
+    return found
+
+
+# returns list of the shard paths of a merged file in shard order, and a
+# message for each shard missing or written with another shard count
+def check(name, counts):
+    problems = []
+    if len(counts) > 1:
+        problems.append('%s written by runs with %s shards, remove those of old runs' % (
+            name, ' and '.join(str(count) for count in sorted(counts))))
+    count = max(counts)
+    missing = [str(index) for index in range(count) if index not in counts[count]]
+    if missing:
+        problems.append('%s missing shard %s of %d' % (name, ', '.join(missing), count))
+    return [counts[count][index] for index in sorted(counts[count])], problems
+
+
+# returns dict of the entries of shard manifests by input file, and a message
+# for each file recorded by more than one shard
+def merge_manifests(paths):
+    entries, problems = {}, []
+    for path in paths:
+        for filepath, entry in manifest.read(path).items():
+            if filepath in entries:
+                problems.append('%s recorded by more than one shard' % filepath)
+            entries[filepath] = entry
+    return entries, problems
+
+
+# checks every shard of every manifest and index is present, then writes the
+# merged files. Nothing is written if any is missing
+def main(argv=None):
+    params = vars(parser.parse_args(argv))
+    output_dir = params['input']
+    merged, problems = {}, []
+    for name, counts in find_shards(output_dir).items():
+        paths, found = check(name, counts)
+        problems.extend(found)
+        if name.endswith('.jsonl'):
+            entries, found = merge_manifests(paths)
+            problems.extend(found)
+            merged[name] = (paths, entries)
+        else:
+            merged[name] = (paths, None)
+    if not merged:
+        print('merge: no shard manifests or indexes in %s' % output_dir)
+    if problems:
+        raise SystemExit('merge: nothing merged\n'+'\n'.join(problems))
+    for name, (paths, entries) in merged.items():
+        if entries is None:
+            metadata.merge(output_dir+'/'+name, paths)
+            print('merge: %s from %d shards' % (name, len(paths)))
+        else:
+            manifest.write(output_dir+'/'+name, entries.values())
+            print('merge: %s from %d shards, %d files' % (name, len(paths), len(entries)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+import os
+import argparse
+import sqlite3
+import mido
+from pathlib import Path
+from . import events
+from . import runner
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will query the metadata index of words and tiles saved by emgen word, emgen tile and emgen pipeline, and print the path of each match. All filters are optional'
+)
+parser.add_argument('-i', '--input', default=os.getcwd(),
+                    help="Path to output directory of emgen word, emgen tile or emgen pipeline. (Defaults to current working directory if not specified)")
+parser.add_argument('-k', '--kind', default=None, choices=['word', 'tile'],
+                    help="Only words or only tiles. (Both if not specified)")
+parser.add_argument('-in', '--instrument', default=None, type=int,
+                    help="General MIDI program number, 0 to 127. (Any instrument if not specified)")
+parser.add_argument('-ks', '--key', default=None,
+                    help="Key signature, as in mido e.g. C or Cm. (Any key if not specified)")
+parser.add_argument('-b', '--bpm', default=None, type=float,
+                    help="Tempo in beats per minute. (Any tempo if not specified)")
+parser.add_argument('-bt', '--bpm_tolerance', default=1, type=float,
+                    help="Tempo range either side of the bpm given. (Defaults to 1 if not specified)")
+parser.add_argument('-minl', '--minimum_length', default=None, type=float,
+                    help="Lower boundary of the length in seconds. (No limit applied if not specified)")
+parser.add_argument('-maxl', '--maximum_length', default=None, type=float,
+                    help="Upper boundary of the length in seconds. (No limit applied if not specified)")
+parser.add_argument('-dp', '--duplicates', action='store_true',
+                    help="Also print tiles deduplicated by emgen tile -dd, as the path of the copy saved. (Left out if not specified)")
+
+# name of the index file in the output directory
+INDEX_NAME = 'metadata.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    kind TEXT NOT NULL,
+    file TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    wavelength INTEGER NOT NULL,
+    start_time_seconds REAL,
+    total_length_seconds REAL,
+    length_seconds REAL,
+    tempo INTEGER,
+    bpm REAL,
+    key TEXT,
+    instrument INTEGER,
+    instrument_name TEXT,
+    note_count INTEGER,
+    lowest_note INTEGER,
+    highest_note INTEGER,
+    path TEXT,
+    hash TEXT,
+    duplicate INTEGER DEFAULT 0,
+    PRIMARY KEY (kind, file, offset, wavelength)
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS features (
+    path TEXT PRIMARY KEY,
+    bpm REAL,
+    key TEXT,
+    mode TEXT,
+    key_estimated INTEGER,
+    note_count INTEGER,
+    lowest_note INTEGER,
+    highest_note INTEGER,
+    pitch_range INTEGER,
+    register REAL,
+    note_density REAL,
+    velocity_mean REAL,
+    velocity_variance REAL,
+    articulation REAL
+);
+CREATE INDEX IF NOT EXISTS hashes_file ON hashes (file);
+CREATE INDEX IF NOT EXISTS items_selection ON items (kind, instrument, key, bpm);
+CREATE INDEX IF NOT EXISTS items_length ON items (length_seconds);
+CREATE INDEX IF NOT EXISTS items_file ON items (file);
+'''
+
+COLUMNS = ['kind', 'file', 'offset', 'wavelength', 'start_time_seconds',
+           'total_length_seconds', 'length_seconds', 'tempo', 'bpm', 'key',
+           'instrument', 'instrument_name', 'note_count', 'lowest_note',
+           'highest_note', 'path', 'hash', 'duplicate']
+
+FEATURE_COLUMNS = ['path', 'bpm', 'key', 'mode', 'key_estimated', 'note_count',
+                   'lowest_note', 'highest_note', 'pitch_range', 'register',
+                   'note_density', 'velocity_mean', 'velocity_variance', 'articulation']
+
+# connections opened by this process, by index path
+connections = {}
+
+
+# returns path of the index in an output directory. A stage run with --shard
+# writes its own, e.g. metadata.0-of-4.sqlite, until emgen merge combines them
+def index_path(output_dir, shard=None):
+    if shard is None:
+        return output_dir+'/'+INDEX_NAME
+    return output_dir+'/%s.sqlite' % runner.shard_name('metadata', shard)
+
+
+# returns connection to the index at path, creating it if needed. Waits for
+# other worker processes holding the write lock rather than failing
+def connect(path):
+    if path not in connections:
+        connection = sqlite3.connect(path, timeout=60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        # indexes created before tiles were deduplicated lack the hash columns
+        existing = [row[1] for row in connection.execute('PRAGMA table_info(items)')]
+        with connection:
+            for column, kind in (('hash', 'TEXT'), ('duplicate', 'INTEGER DEFAULT 0')):
+                if column not in existing:
+                    connection.execute('ALTER TABLE items ADD COLUMN %s %s' % (column, kind))
+        connections[path] = connection
+    return connections[path]
+
+
+# returns a read-only connection to the index at path, which must exist, for
+# reading an index without creating or changing it
+def connect_readonly(path):
+    if not os.path.isfile(path):
+        raise FileNotFoundError('no metadata index at %s' % path)
+    return sqlite3.connect(Path(os.path.abspath(path)).as_uri()+'?mode=ro', uri=True, timeout=60)
+
+
+# returns (tempo, key) from the first set_tempo and key_signature messages of
+# the header track of an EventTable, either None if not found
+def header_fields(table):
+    rows = table.tracks[0]
+    tempos = rows['data'][rows['type'] == events.SET_TEMPO]
+    keys = rows['data'][rows['type'] == events.KEY_SIGNATURE]
+    tempo = int(tempos[0]) if len(tempos) else None
+    key = events.KEY_NAMES[keys[0]] if len(keys) else None
+    return tempo, key
+
+
+# returns (note count, lowest note, highest note) of the note on messages in
+# event rows, the notes None if there are none
+def note_fields(rows):
+    notes = rows['note'][(rows['type'] == events.NOTE_ON) & (rows['velocity'] > 0)]
+    if len(notes) == 0:
+        return 0, None, None
+    return len(notes), int(notes.min()), int(notes.max())
+
+
+# returns an index row for a word or tile. Takes its metadata dict, event
+# rows, length in seconds, (tempo, key) of the source file, program number
+# and name, and the path or packed name it was saved to. A duplicate holds
+# the path of the copy saved with the same content hash
+def item(kind, meta, rows, length, header, program, name, path, digest=None,
+         duplicate=False):
+    tempo, key = header
+    count, lowest, highest = note_fields(rows)
+    return (kind, meta['file'], meta['offset'], meta['wavelength'],
+            float(meta['start_time_seconds']), float(meta['total_length_seconds']),
+            length, tempo, mido.tempo2bpm(tempo) if tempo is not None else None,
+            key, program, name, count, lowest, highest, path, digest, int(duplicate))
+
+
+# replaces the rows of a source file and kind with items, in one transaction.
+# Features of the copies saved from it are removed, to be computed again
+def replace(path, kind, filepath, items):
+    connection = connect(path)
+    with connection:
+        connection.execute('DELETE FROM features WHERE path IN (SELECT path FROM items '
+                           'WHERE kind = ? AND file = ? AND duplicate = 0)', (kind, filepath))
+        connection.execute('DELETE FROM items WHERE kind = ? AND file = ?',
+                           (kind, filepath))
+        connection.executemany('INSERT OR REPLACE INTO items VALUES (%s)' %
+                               ', '.join('?' * len(COLUMNS)), items)
+
+
+# adds items to the rows of their source files, in one transaction
+def add(path, items):
+    connection = connect(path)
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO items VALUES (%s)' %
+                               ', '.join('?' * len(COLUMNS)), items)
+
+
+# registers the saved copy of each (content hash, path) pair from a source
+# file, unless another copy was registered first, in one transaction.
+# Returns dict of the path of the registered copy by content hash
+def claim(path, filepath, copies):
+    connection = connect(path)
+    with connection:
+        connection.executemany('INSERT OR IGNORE INTO hashes VALUES (?, ?, ?)',
+                               [(digest, filepath, saved) for digest, saved in copies])
+        return {digest: connection.execute('SELECT path FROM hashes WHERE hash = ?',
+                                           (digest,)).fetchone()[0]
+                for digest, saved in copies}
+
+
+# releases the content hashes registered for copies saved from a source file,
+# before it is processed again
+def release(path, filepath):
+    connection = connect(path)
+    with connection:
+        connection.execute('DELETE FROM hashes WHERE file = ?', (filepath,))
+
+
+# returns set of the source files with tiles indexed as references to a copy
+# saved from one of files, or from one of those source files in turn. They
+# are processed again with files, as the copies they reference are removed.
+# Opens its own connection, so none is left open in a process that forks
+# workers
+def referencing(path, files):
+    if not os.path.exists(path):
+        return set()
+    connection = sqlite3.connect(path, timeout=60)
+    try:
+        found, new = set(files), list(files)
+        while new:
+            batch, new = new[:500], new[500:]
+            rows = connection.execute(
+                'SELECT DISTINCT items.file FROM items JOIN hashes ON items.hash = hashes.hash '
+                'WHERE items.duplicate = 1 AND hashes.file IN (%s)' % ', '.join('?' * len(batch)),
+                batch).fetchall()
+            for (filepath,) in rows:
+                if filepath not in found:
+                    found.add(filepath)
+                    new.append(filepath)
+        return found - set(files)
+    finally:
+        connection.close()
+
+
+# returns list of the source files of the words, tiles and copies in the
+# index at path, empty if there is no index
+def source_files(path):
+    if not os.path.exists(path):
+        return []
+    connection = sqlite3.connect(path, timeout=60)
+    try:
+        return [row[0] for row in connection.execute(
+            'SELECT file FROM items UNION SELECT file FROM hashes')]
+    finally:
+        connection.close()
+
+
+# removes the rows, copies registered and features of source files from the
+# index at path, in one transaction, before they are processed again
+def forget(path, files):
+    if not files or not os.path.exists(path):
+        return
+    connection = sqlite3.connect(path, timeout=60)
+    rows = [(filepath,) for filepath in files]
+    try:
+        with connection:
+            connection.executemany('DELETE FROM features WHERE path IN (SELECT path FROM items '
+                                   'WHERE file = ? AND duplicate = 0)', rows)
+            connection.executemany('DELETE FROM items WHERE file = ?', rows)
+            connection.executemany('DELETE FROM hashes WHERE file = ?', rows)
+    finally:
+        connection.close()
+
+
+# combines the indexes written by each shard of a run into the index at path,
+# in one transaction. Rows of every source file in a shard index replace the
+# rows of that file. When tiles were deduplicated, the copy saved by the
+# lowest shard is kept for each content hash, and the items of copies saved
+# by other shards become references to it. Their files are left in place
+def merge(path, shard_paths):
+    connection = connect(path)
+    with connection:
+        sources = [sqlite3.connect(shard_path) for shard_path in shard_paths]
+        for source in sources:
+            files = source.execute('SELECT file FROM items UNION SELECT file FROM hashes')
+            connection.executemany('DELETE FROM features WHERE path IN (SELECT path FROM items '
+                                   'WHERE file = ? AND duplicate = 0)', files)
+            files = source.execute('SELECT file FROM items UNION SELECT file FROM hashes')
+            connection.executemany('DELETE FROM items WHERE file = ?', files)
+            files = source.execute('SELECT file FROM items UNION SELECT file FROM hashes')
+            connection.executemany('DELETE FROM hashes WHERE file = ?', files)
+        for source in sources:
+            connection.executemany('INSERT OR REPLACE INTO items VALUES (%s)' %
+                                   ', '.join('?' * len(COLUMNS)),
+                                   source.execute('SELECT %s FROM items' % ', '.join(COLUMNS)))
+            connection.executemany('INSERT OR IGNORE INTO hashes VALUES (?, ?, ?)',
+                                   source.execute('SELECT hash, file, path FROM hashes'))
+            source.close()
+        connection.execute(
+            'UPDATE items SET duplicate = 1, path = (SELECT path FROM hashes WHERE hashes.hash = items.hash) '
+            'WHERE path != (SELECT path FROM hashes WHERE hashes.hash = items.hash)')
+
+
+# returns list of (path, length in seconds) of the words and tiles saved, not
+# references to a copy, that have no features yet, or of all of them if every
+def unmeasured(path, every=False):
+    sql = 'SELECT path, length_seconds FROM items WHERE duplicate = 0'
+    if not every:
+        sql += ' AND path NOT IN (SELECT path FROM features)'
+    return connect(path).execute(sql).fetchall()
+
+
+# stores rows of FEATURE_COLUMNS values, replacing any for the same paths
+def replace_features(path, rows):
+    connection = connect(path)
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO features VALUES (%s)' %
+                               ', '.join('?' * len(FEATURE_COLUMNS)), rows)
+
+
+# returns list of dicts for the items in the index at path matching every
+# filter given. bpm matches within bpm_tolerance either side. Duplicates
+# are left out unless duplicates is True. The index is only read, and
+# FileNotFoundError raised if there is none
+def query(path, kind=None, instrument=None, key=None, bpm=None, bpm_tolerance=1,
+          minimum_length=None, maximum_length=None, duplicates=False):
+    clauses, values = [], []
+    if not duplicates:
+        clauses.append('duplicate = 0')
+    for column, value in (('kind', kind), ('instrument', instrument), ('key', key)):
+        if value is not None:
+            clauses.append('%s = ?' % column)
+            values.append(value)
+    if bpm is not None:
+        clauses.append('bpm BETWEEN ? AND ?')
+        values.extend([bpm - bpm_tolerance, bpm + bpm_tolerance])
+    if minimum_length is not None:
+        clauses.append('length_seconds >= ?')
+        values.append(minimum_length)
+    if maximum_length is not None:
+        clauses.append('length_seconds <= ?')
+        values.append(maximum_length)
+    sql = 'SELECT %s FROM items' % ', '.join(COLUMNS)
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    connection = connect_readonly(path)
+    try:
+        return [dict(zip(COLUMNS, row)) for row in connection.execute(sql, values)]
+    finally:
+        connection.close()
+
+
+# print the path of every item matching the arguments
+def main(argv=None):
+    params = vars(parser.parse_args(argv))
+    path = params['input']+'/'+INDEX_NAME
+    if not os.path.isfile(path):
+        raise SystemExit('query: no metadata index in %s, run emgen word, emgen tile or emgen pipeline there first'
+                         % params['input'])
+    for row in query(path, params['kind'], params['instrument'],
+                     params['key'], params['bpm'], params['bpm_tolerance'],
+                     params['minimum_length'], params['maximum_length'], params['duplicates']):
+        print(row['path'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import os
+import time
+import json
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# prefix of every exported Prometheus metric
+PREFIX = 'emgen_'
+
+# counts and seconds recorded by the current thread since last taken
+local = threading.local()
+
+# totals of a run, merged from every worker in the process reporting them
+totals = {'counters': Counter(), 'timers': Counter()}
+
+# start of the run, taken when the stage module is imported or reset
+started = time.time()
+
+
+# returns (counters, timers, stack of seconds spent in nested timers) of the
+# current thread
+def recorded():
+    if not hasattr(local, 'counters'):
+        local.counters = Counter()
+        local.timers = Counter()
+        local.stack = []
+    return local.counters, local.timers, local.stack
+
+
+# adds n to a counter, e.g. files_invalid or tiles_emitted
+def count(name, n=1):
+    recorded()[0][name] += n
+
+
+# adds the seconds spent in the with block to a timer, one of parse,
+# transform, validate or write. Time spent in timers nested inside is
+# only added to those, so the steps add up to the total
+@contextmanager
+def timed(name):
+    timers, stack = recorded()[1:]
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timers[name] += elapsed - stack.pop()
+        if stack:
+            stack[-1] += elapsed
+
+
+# returns dict of counts and seconds recorded by the current thread and
+# clears them, to be merged into the totals of the process reporting them
+def take():
+    counters, timers = recorded()[:2]
+    snapshot = {'counters': dict(counters), 'timers': dict(timers)}
+    counters.clear()
+    timers.clear()
+    return snapshot
+
+
+# adds a snapshot from take() to the run totals
+def merge(snapshot):
+    totals['counters'].update(snapshot['counters'])
+    totals['timers'].update(snapshot['timers'])
+
+
+# returns run totals as Prometheus text exposition format, with the stage
+# as a label. Timers are one metric labelled by step
+def prometheus(stage):
+    lines = []
+    for name in sorted(totals['counters']):
+        metric = PREFIX+name+'_total'
+        lines.append('# TYPE %s counter' % metric)
+        lines.append('%s{stage="%s"} %s' % (metric, stage, totals['counters'][name]))
+    metric = PREFIX+'run_seconds'
+    lines.append('# TYPE %s gauge' % metric)
+    lines.append('%s{stage="%s"} %f' % (metric, stage, time.time() - started))
+    if totals['timers']:
+        metric = PREFIX+'step_seconds_total'
+        lines.append('# TYPE %s counter' % metric)
+        for name in sorted(totals['timers']):
+            lines.append('%s{stage="%s",step="%s"} %f' % (
+                metric, stage, name, totals['timers'][name]))
+    return '\n'.join(lines)+'\n'
+
+
+# clears the run totals and anything recorded by this thread, and restarts
+# the run clock, for a run started in a process that has run others before
+def reset():
+    global started
+    take()
+    totals['counters'].clear()
+    totals['timers'].clear()
+    started = time.time()
+
+
+# merges anything recorded by this thread into the run totals, then writes
+# them to <stage>_metrics.json and <stage>_metrics.prom in the output
+# directory, and prints a one line summary
+def report(output_dir, stage):
+    merge(take())
+    summary = {'stage': stage, 'seconds': time.time() - started,
+               'counters': dict(totals['counters']), 'timers': dict(totals['timers'])}
+    with open(output_dir+'/%s_metrics.json' % stage, 'w') as f:
+        json.dump(summary, f, indent=2)
+    # written then renamed, so a textfile collector never reads half a file
+    prom_path = output_dir+'/%s_metrics.prom' % stage
+    with open(prom_path+'.tmp', 'w') as f:
+        f.write(prometheus(stage))
+    os.replace(prom_path+'.tmp', prom_path)
+    print('%s: %s' % (stage, ', '.join('%s %d' % (name, value) for name, value
+                                       in sorted(totals['counters'].items()))))
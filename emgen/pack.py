@@ -0,0 +1,187 @@
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will concatenate a folder of MIDI files into one packed corpus, <output>.pack, with the offset and length of each file in <output>.index.jsonl. Pass the .pack file as the input of any stage to read every file straight from it, without opening each one'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=None,
+                    help="Path of the packed corpus, .pack added if not given. (Defaults to the input directory with .pack added if not specified)")
+parser.add_argument('-j', '--jobs', '-t', '--threads', dest='jobs', default=16, type=int,
+                    help="Number of threads reading files at the same time. (Defaults to 16 if not specified)")
+
+# extension of a packed corpus
+EXTENSION = '.pack'
+
+# number of files read at a time while packing
+BATCH_SIZE = 1024
+
+
+# returns path of the index of a packed corpus
+def index_path(pack_path):
+    return pack_path[:-len(EXTENSION)]+'.index.jsonl'
+
+
+# returns True if path is a packed corpus
+def is_corpus(path):
+    return path.endswith(EXTENSION) and os.path.isfile(path)
+
+
+# returns (corpus path, path within it) of a file within a packed corpus, or
+# None for any other file. Stages name a packed file as if the corpus were
+# its folder, e.g. corpus.pack/folder/song.mid
+def split(filepath):
+    start = filepath.find(EXTENSION+'/')
+    while start >= 0:
+        pack_path = filepath[:start+len(EXTENSION)]
+        if pack_path in corpora or os.path.isfile(pack_path):
+            return pack_path, filepath[start+len(EXTENSION)+1:]
+        start = filepath.find(EXTENSION+'/', start+1)
+    return None
+
+
+# returns True if a file path names a file within a packed corpus
+def is_member(filepath):
+    return split(filepath) is not None
+
+
+# returns path of filepath relative to a directory, or to the packed corpus
+# holding it, with / separators
+def relative(filepath, input_dir):
+    member = split(filepath)
+    if member is not None:
+        return member[1]
+    return os.path.relpath(filepath, input_dir).replace(os.sep, '/')
+
+
+# Read access to one packed corpus. The corpus is memory-mapped and its index
+# loaded into a dict, giving each file as a view of the map without copying
+class Corpus:
+
+    def __init__(self, pack_path):
+        self.path = pack_path
+        self.index = {}
+        with open(index_path(pack_path), 'r') as f:
+            for line in f:
+                entry = json.loads(line)
+                self.index[entry['file']] = entry
+        self.file = open(pack_path, 'rb')
+        st = os.fstat(self.file.fileno())
+        self.mtime = st.st_mtime
+        self.data = memoryview(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                               if st.st_size else b'')
+
+    # returns the names stages give the files of the corpus, in packed order,
+    # only those at its top level unless recursive
+    def files(self, recursive=True):
+        return [self.path+'/'+name for name in self.index
+                if recursive or '/' not in name]
+
+    # returns the SMF data of a file as a view of the map
+    def read(self, name):
+        entry = self.index[name]
+        return self.data[entry['start']:entry['start']+entry['length']]
+
+
+# corpora opened by this process, by path
+corpora = {}
+
+
+# returns the Corpus at path, opened once per process
+def open_corpus(pack_path):
+    if pack_path not in corpora:
+        corpora[pack_path] = Corpus(pack_path)
+    return corpora[pack_path]
+
+
+# returns list of the MIDI files of an input directory, or of the files
+# within it if input is a packed corpus. Only those at the top level of
+# either unless recursive
+def files(input_dir, recursive=True):
+    if is_corpus(input_dir):
+        return open_corpus(input_dir).files(recursive)
+    paths = Path(input_dir).rglob('*.mid') if recursive else Path(input_dir).glob('*.mid')
+    return [str(path) for path in paths]
+
+
+# returns the SMF data of a file, as a view of its corpus if packed. size
+# limits the bytes read
+def read(filepath, size=None):
+    member = split(filepath)
+    if member is not None:
+        data = open_corpus(member[0]).read(member[1])
+        return data if size is None else data[:size]
+    with open(filepath, 'rb') as f:
+        return f.read(size)
+
+
+# returns (size, mtime, hash) of a file within a packed corpus: its length,
+# the mtime of the corpus and the content hash recorded when it was packed
+def stat(filepath):
+    pack_path, name = split(filepath)
+    corpus = open_corpus(pack_path)
+    entry = corpus.index[name]
+    return entry['length'], corpus.mtime, entry['hash']
+
+
+# copies a file into directory, keeping its name, as shutil.copy2 does
+def copy(filepath, directory):
+    if not is_member(filepath):
+        shutil.copy2(filepath, directory)
+        return
+    with open(os.path.join(directory, os.path.basename(filepath)), 'wb') as f:
+        f.write(read(filepath))
+
+
+# returns content of a file and its index entry, without the start
+def read_file(filepath, input_dir):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    # same digest as manifest.content_hash, so manifests agree on the file
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return data, {'file': relative(filepath, input_dir), 'length': len(data), 'hash': digest}
+
+
+# writes every file to the corpus at pack_path and its index, read on threads
+# a batch at a time. Both are written then renamed, replacing any earlier
+# corpus. Returns list of index entries
+def write(pack_path, input_dir, filepaths, jobs=16):
+    entries = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool, open(pack_path+'.tmp', 'wb') as blob:
+        for batch in range(0, len(filepaths), BATCH_SIZE):
+            for data, entry in pool.map(lambda filepath: read_file(filepath, input_dir),
+                                        filepaths[batch:batch+BATCH_SIZE]):
+                entry['start'] = blob.tell()
+                blob.write(data)
+                entries.append(entry)
+    with open(index_path(pack_path)+'.tmp', 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry)+'\n')
+    os.replace(pack_path+'.tmp', pack_path)
+    os.replace(index_path(pack_path)+'.tmp', index_path(pack_path))
+    return entries
+
+
+# packs every MIDI file of the input directory, in the order stages list them
+def main(argv=None):
+    params = vars(parser.parse_args(argv))
+    input_dir = params['input']
+    pack_path = params['output'] or input_dir.rstrip('/\\')+EXTENSION
+    if not pack_path.endswith(EXTENSION):
+        pack_path += EXTENSION
+    Path(os.path.dirname(os.path.abspath(pack_path))).mkdir(parents=True, exist_ok=True)
+    entries = write(pack_path, input_dir, files(input_dir), params['jobs'])
+    print('pack: %d files, %d bytes in %s' % (
+        len(entries), sum(entry['length'] for entry in entries), pack_path))
+
+
+if __name__ == '__main__':
+    main()
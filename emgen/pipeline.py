@@ -0,0 +1,245 @@
+import os
+import argparse
+from pathlib import Path
+from functools import partial
+from . import events
+from . import runner
+from . import pack
+from . import manifest
+from . import metadata
+from . import shards
+from . import metrics
+from . import cache
+from . import smf
+from . import writer
+from . import smf_type1
+from . import instrument_isolate
+from . import data_cleanse
+from . import word
+from . import tile
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take a folder of MIDI files and run emgen type1, emgen isolate, emgen cleanse, emgen word and emgen tile over each file in memory, saving only words and tiles. Intermediate type_1, source_separated and cleaned files are saved only in debug mode'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+parser.add_argument('-s', '--stages', nargs='+', default=['words', 'tiles'], choices=['words', 'tiles'],
+                    help="Final stages to run on the cleaned files. (Defaults to both words and tiles if not specified)")
+parser.add_argument('-d', '--debug', action='store_true',
+                    help="Save the intermediate type_1, source_separated and cleaned files, as the separate scripts would. (Not saved if not specified)")
+parser.add_argument('-ms', '--minimum_silence', default=0.5, type=float,
+                    help="Value in seconds of the silence gap significant enough to determine a word. (Defaults to 0.5 seconds if not specified)")
+parser.add_argument('-wl', '--word_limit', default=None, type=int,
+                    help="Upper boundary of number of words per file passed. (No limit applied if not specified)")
+parser.add_argument('-wmt', '--word_maximum_time', default=10, type=int,
+                    help="Upper boundary of the time in seconds that a word may be. (Defaults to 10 seconds if not specified)")
+parser.add_argument('-lw', '--lower_wavelength', default=5, type=int,
+                    help="Lower boundary of the tile wavelength, i.e. the lowest number of messages that a tile can have. (Defaults to 5 if not specified)")
+parser.add_argument('-uw', '--upper_wavelength', default=200, type=int,
+                    help="Upper boundary of the tile wavelength, i.e. the highest number of messages that a tile can have. (Defaults to 200 if not specified)")
+parser.add_argument('-tl', '--tile_limit', default=None, type=int,
+                    help="Upper boundary of number of tiles per file passed. (No limit applied if not specified)")
+parser.add_argument('-tmt', '--tile_maximum_time', default=30, type=int,
+                    help="Upper boundary of the time in seconds that a tile may be. (Defaults to 30 seconds if not specified)")
+parser.add_argument('-dd', '--dedup', action='store_true',
+                    help="Save one copy of tiles with the same messages across all files, recording the others in the metadata index as references to it. (Every tile saved if not specified)")
+parser.add_argument('-mx', '--maximal', action='store_true',
+                    help="Save only maximal tiles, leaving out repeats contained in a longer repeat at the same wavelength, and stop searching longer wavelengths at each offset once the messages last longer than the tile maximum time. (Every repeat saved if not specified)")
+parser.add_argument('-mm', '--matching', default='exact', choices=['exact', 'interval'],
+                    help="How messages are compared when searching for tiles. exact compares every value, interval compares notes by their pitch interval from the message before, with time deltas rounded to the quantize steps and velocities compared by bucket, so phrases played higher, lower or slightly off the beat repeat. (Defaults to exact if not specified)")
+parser.add_argument('-qs', '--quantize_steps', default=4, type=runner.positive_int,
+                    help="Number of steps per beat that time deltas are rounded to with interval matching. (Defaults to 4 if not specified)")
+parser.add_argument('-vb', '--velocity_buckets', default=None, type=runner.positive_int,
+                    help="Number of equal velocity ranges that notes must share to match with interval matching. (Velocity not compared if not specified)")
+runner.add_arguments(parser)
+runner.add_shard_arguments(parser)
+shards.add_arguments(parser)
+cache.add_arguments(parser)
+writer.add_arguments(parser)
+manifest.add_arguments(parser)
+
+
+# stores pipeline arguments as module variables and passes the matching ones
+# on to each stage. Takes dict of argument values, parser defaults are used
+# for any not given
+def configure(params):
+    global output_dir, stages, debug
+    def get(name): return runner.argument(parser, params, name)
+    output_dir = get('output')
+    stages = get('stages')
+    debug = get('debug')
+    cache.configure(get('cache_dir'))
+    smf_type1.configure({'output': output_dir})
+    instrument_isolate.configure({'output': output_dir})
+    data_cleanse.configure({'output': output_dir})
+    word.configure({'output': output_dir,
+                    'minimum_silence': get('minimum_silence'),
+                    'word_limit': get('word_limit'),
+                    'maximum_time': get('word_maximum_time'),
+                    'packed': get('packed'),
+                    'write_threads': get('write_threads'),
+                    'shard': get('shard')})
+    tile.configure({'output': output_dir,
+                    'lower_wavelength': get('lower_wavelength'),
+                    'upper_wavelength': get('upper_wavelength'),
+                    'tile_limit': get('tile_limit'),
+                    'maximum_time': get('tile_maximum_time'),
+                    'packed': get('packed'),
+                    'dedup': get('dedup'),
+                    'maximal': get('maximal'),
+                    'matching': get('matching'),
+                    'quantize_steps': get('quantize_steps'),
+                    'velocity_buckets': get('velocity_buckets'),
+                    'write_threads': get('write_threads'),
+                    'shard': get('shard')})
+
+
+configure({})
+
+
+# keeps files of SMF type 1 as in smf_type1.py, reading only the header of
+# the others. Each kept file is read once, through the cache. Yields (file
+# path, EventTable). Paths of saved files are appended to outputs
+def type_filter(files, outputs):
+    for filepath in files:
+        with metrics.timed('parse'):
+            header = smf_type1.read_header(filepath)
+        if header is None or header[0] != 1:
+            metrics.count('files_invalid')
+            continue
+        if debug:
+            Path(smf_type1.new_dir).mkdir(parents=True, exist_ok=True)
+            with metrics.timed('write'):
+                pack.copy(filepath, smf_type1.new_dir)
+            outputs.append(smf_type1.new_dir+os.path.basename(filepath))
+        with metrics.timed('parse'):
+            table = cache.load(filepath)
+        metrics.count('messages_processed', sum(len(rows) for rows in table.tracks))
+        yield filepath, table
+
+
+# splits each file into instrument parts as in instrument_isolate.py
+# yields (file path, EventTable) for each valid part
+def isolate(tables, outputs):
+    instruments = runner.load_instruments()
+    for filepath, table in tables:
+        file_name = os.path.basename(filepath)
+        drum_free = instrument_isolate.without_drums(table)
+        for program, part in instrument_isolate.separate(drum_free):
+            with metrics.timed('validate'):
+                valid = instrument_isolate.is_valid(part)
+            if not valid:
+                print('Invalid file not saved: %s – %s' %
+                      (filepath, instruments[program]))
+                metrics.count('parts_invalid')
+                continue
+            if debug:
+                new_dir = output_dir+'/source_separated/'+instruments[program]+'/'
+                with metrics.timed('write'):
+                    writer.write(new_dir+file_name, smf.encode(
+                        part.tracks, part.ticks_per_beat, part.extras, part.type))
+                outputs.append(new_dir+file_name)
+            yield filepath, part
+
+
+# cleans each instrument part as in data_cleanse.py, yields (path the cleaned
+# file is saved to in debug mode, EventTable) for each valid part
+def cleanse(parts, outputs):
+    instruments = runner.load_instruments()
+    for filepath, part in parts:
+        instrument, cleaned = data_cleanse.clean_table(part)
+        with metrics.timed('validate'):
+            valid = data_cleanse.is_valid(cleaned)
+        if not valid:
+            print('Invalid file not saved: %s' % filepath)
+            metrics.count('parts_invalid')
+            continue
+        new_dir = output_dir+'/cleaned/'+instruments[instrument]+'/'
+        cleaned_path = new_dir+os.path.basename(filepath)
+        if debug:
+            with metrics.timed('write'):
+                writer.write(cleaned_path, smf.encode(
+                    cleaned.tracks, cleaned.ticks_per_beat, cleaned.extras, cleaned.type))
+            outputs.append(cleaned_path)
+        yield cleaned_path, cleaned
+
+
+# creates words and tiles from each cleaned part
+def extract(cleaned_parts, outputs):
+    for cleaned_path, cleaned in cleaned_parts:
+        # end of track messages added as if the file was saved and read back
+        table = events.EventTable([smf.fix_end_of_track(rows) for rows in cleaned.tracks],
+                                  cleaned.ticks_per_beat, cleaned.extras, cleaned.type)
+        if 'words' in stages:
+            outputs.extend(word.create_words(cleaned_path, table))
+        if 'tiles' in stages:
+            outputs.extend(tile.create_tiles(cleaned_path, table))
+
+
+# passes one file through every stage, returns list of saved file paths
+def process(filepath):
+    outputs = []
+    extract(cleanse(isolate(type_filter([filepath], outputs), outputs), outputs), outputs)
+    with metrics.timed('write'):
+        writer.flush()
+    return outputs
+
+
+# returns the source files in the index of the cleaned parts of input files,
+# saved with the file name of their input in each instrument folder
+def cleaned_parts(files):
+    names = set(os.path.basename(filepath) for filepath in files)
+    return [filepath for filepath in metadata.source_files(tile.index_path)
+            if os.path.basename(filepath) in names]
+
+
+# returns input files whose tiles reference copies saved from the tiles of
+# changed input files
+def referencing(files, changed):
+    inputs = {os.path.basename(filepath): filepath for filepath in files}
+    names = set(os.path.basename(filepath)
+                for filepath in metadata.referencing(tile.index_path, cleaned_parts(changed)))
+    return [inputs[name] for name in names if name in inputs]
+
+
+# add all file paths to list, pass each file through process()
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    configure(params)
+    input_dir = params['input']
+    jobs = params['jobs']
+    stage = runner.shard_name('pipeline', params['shard'])
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    newlist = pack.files(input_dir, recursive=False)
+    newlist = runner.shard_files(newlist, input_dir, params['shard'])
+    stage_params = {name: value for name, value in params.items()
+                    if name not in ('input', 'output', 'jobs', 'force', 'cache_dir',
+                                    'write_threads', 'shard')}
+    stage_manifest = manifest.Manifest(
+        output_dir+'/%s.jsonl' % runner.shard_name('pipeline_manifest', params['shard']), stage_params)
+    # with dedup, files holding references to copies saved from a changed
+    # file are processed again with it, as those copies are removed
+    todo = stage_manifest.pending(newlist, params['force'], dependents=partial(
+        referencing, newlist) if params['dedup'] and 'tiles' in stages else None)
+    # parts of a file processed again may now be of other instruments, so the
+    # rows of all its earlier parts are removed rather than replaced
+    metadata.forget(tile.index_path, cleaned_parts(todo))
+    errors = []
+    for file, outputs in runner.run(process, todo, jobs, errors,
+                                    initializer=configure, initargs=(params,),
+                                    stage=stage):
+        stage_manifest.record(file, outputs)
+    stage_manifest.close()
+    runner.report_errors(errors, output_dir, stage)
+    metrics.report(output_dir, stage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import hashlib
+from bisect import bisect_left
+import numpy as np
+from . import events
+
+
+# number of offsets searched at a time by stream_repeats
+BLOCK_SIZE = 1024
+
+
+# returns a hashable key for a mido message, equal keys for equal messages
+# (mido compares messages by their attributes, including time)
+def message_key(msg):
+    return tuple((name, tuple(value) if isinstance(value, list) else value)
+                 for name, value in sorted(vars(msg).items()))
+
+
+# columns of an event row compared when matching rows and hashing tiles
+KEY_COLUMNS = ['type', 'channel', 'note', 'velocity', 'program', 'data', 'delta']
+
+
+# returns list of the keys canonical_hash gives the messages in extras, as
+# bytes, found once per file rather than once per tile
+def extra_keys(extras):
+    return [repr(message_key(msg.copy(time=0))).encode() for msg in extras]
+
+
+# returns hex digest identifying a tile or word by the content of its event
+# rows, the same for equal rows whatever the time delta of the first row.
+# Rows are hashed by the columns compared when matching, and rows stored as
+# OTHER by the key of their message from extra_keys. ticks_per_beat and
+# program number are included as they change the result
+def canonical_hash(rows, keys, ticks_per_beat, program):
+    columns = np.stack([rows[name].astype(np.int64) for name in KEY_COLUMNS], axis=1)
+    columns[:1, 6] = 0
+    others = rows['type'] == events.OTHER
+    columns[others, 1:6] = 0
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((ticks_per_beat, program)).encode())
+    digest.update(columns.tobytes())
+    for i in rows['data'][others].tolist():
+        digest.update(keys[i])
+    return digest.hexdigest()
+
+
+# encodes a list of messages as a list of integers, where equal messages
+# share the same integer. Takes list of messages, returns list of ints
+def encode_messages(msglist):
+    codebook = {}
+    codes = []
+    for msg in msglist:
+        codes.append(codebook.setdefault(message_key(msg), len(codebook)))
+    return codes
+
+
+# encodes an event array as a list of integers, the same list encode_messages
+# returns for its messages. Rows are compared by their columns, and rows stored
+# as OTHER by the attributes of their message in extras
+def encode_rows(rows, extras):
+    codebook = {}
+    codes = []
+    for row in rows.tolist():
+        key = row[:7]
+        if row[0] == events.OTHER:
+            key = (row[0], message_key(extras[row[5]].copy(time=0)), row[6])
+        codes.append(codebook.setdefault(key, len(codebook)))
+    return codes
+
+
+# builds the suffix array of an integer sequence by prefix doubling,
+# returns list of suffix start positions in sorted order
+def suffix_array(codes):
+    n = len(codes)
+    sa = list(range(n))
+    rank = list(codes)
+    if n < 2:
+        return sa
+    k = 1
+    while True:
+        def key(i): return (rank[i], rank[i+k] if i+k < n else -1)
+        sa.sort(key=key)
+        new_rank = [0] * n
+        for j in range(1, n):
+            new_rank[sa[j]] = new_rank[sa[j-1]] + \
+                (key(sa[j-1]) < key(sa[j]))
+        rank = new_rank
+        if rank[sa[-1]] == n - 1:
+            return sa
+        k *= 2
+
+
+# builds the LCP array (Kasai's algorithm), where lcp[r] is the length of the
+# common prefix of the suffixes at sa[r-1] and sa[r]. Returns lcp and rank lists
+def lcp_array(codes, sa):
+    n = len(codes)
+    rank = [0] * n
+    for r, i in enumerate(sa):
+        rank[i] = r
+    lcp = [0] * n
+    h = 0
+    for i in range(n):
+        if rank[i] > 0:
+            j = sa[rank[i] - 1]
+            while i+h < n and j+h < n and codes[i+h] == codes[j+h]:
+                h += 1
+            lcp[rank[i]] = h
+            if h > 0:
+                h -= 1
+        else:
+            h = 0
+    return lcp, rank
+
+
+# builds a sparse table over the LCP array so the minimum of any range
+# can be found in constant time
+def sparse_table(lcp):
+    table = [lcp]
+    span = 1
+    while span * 2 <= len(lcp):
+        prev = table[-1]
+        table.append([min(prev[i], prev[i+span])
+                      for i in range(len(lcp) - span * 2 + 1)])
+        span *= 2
+    return table
+
+
+# returns the longest wavelength at each offset of a list of time deltas
+# whose messages span at most max_ticks, as an array
+def wavelength_limits(deltas, max_ticks):
+    ticks = np.concatenate([[0], np.cumsum(deltas)])
+    return (np.searchsorted(ticks, ticks[:-1] + max_ticks, side='right') - 1
+            - np.arange(len(deltas)))
+
+
+# finds every (offset, wavelength) pair in an encoded message list where the
+# message at offset repeats wavelength messages later, for wavelengths in
+# range(lower_wavelength, upper_wavelength). Yields (offset, wavelength, matched)
+# in offset then wavelength order, where matched is the number of consecutive
+# messages that repeat, capped at the wavelength and the end of the list.
+# If maximal, pairs contained in a longer repeat, where the message before
+# offset repeats too, are left out. limits is the longest wavelength searched
+# at each offset, if given
+def find_repeats(codes, lower_wavelength, upper_wavelength, maximal=False,
+                 limits=None):
+    n = len(codes)
+    lower_wavelength = max(lower_wavelength, 1)
+    if n < 2 or lower_wavelength >= upper_wavelength:
+        return
+
+    sa = suffix_array(codes)
+    lcp, rank = lcp_array(codes, sa)
+    table = sparse_table(lcp)
+
+    # length of the common prefix of the suffixes starting at i and j
+    def common_prefix(i, j):
+        lo, hi = sorted((rank[i], rank[j]))
+        lo += 1
+        level = (hi - lo + 1).bit_length() - 1
+        row = table[level]
+        return min(row[lo], row[hi - (1 << level) + 1])
+
+    # only positions holding the same message can start a repeat
+    positions = {}
+    for i, code in enumerate(codes):
+        positions.setdefault(code, []).append(i)
+
+    for offset in range(n):
+        plist = positions[codes[offset]]
+        longest = upper_wavelength if limits is None else min(
+            upper_wavelength, limits[offset] + 1)
+        for k in range(bisect_left(plist, offset + lower_wavelength), len(plist)):
+            wavelength = plist[k] - offset
+            if wavelength >= longest:
+                break
+            if maximal and offset and codes[offset-1] == codes[plist[k]-1]:
+                continue
+            matched = min(common_prefix(offset, plist[k]),
+                          wavelength, n - plist[k])
+            yield offset, wavelength, matched
+
+
+# returns the columns encode_rows compares of each row of an event array, as
+# an int64 array of (type, channel, note, velocity, program, data, delta)
+# rows. Rows stored as OTHER hold a number for their message in extras
+def key_columns(rows, extras):
+    keys = np.stack([rows[name].astype(np.int64) for name in KEY_COLUMNS], axis=1)
+    others = np.flatnonzero(rows['type'] == events.OTHER)
+    if len(others):
+        codebook = {}
+        keys[others, 1:5] = 0
+        keys[others, 5] = [codebook.setdefault(message_key(extras[i].copy(time=0)), len(codebook))
+                           for i in rows['data'][others].tolist()]
+    return keys
+
+
+# returns an array of integers for the rows of an int64 array, equal for
+# equal rows
+def number_rows(keys):
+    return np.unique(keys, axis=0, return_inverse=True)[1].reshape(-1)
+
+
+# encodes an event array as an array of integers, equal where encode_rows
+# gives equal integers, though not the same ones
+def encode_window(rows, extras):
+    return number_rows(key_columns(rows, extras))
+
+
+# encodes an event array as an array of integers that are equal for the same
+# phrase played higher or lower, or slightly off the beat. Notes are compared
+# by their pitch interval from the note of the row before, or by pitch after a
+# row without a note, and note_on at velocity 0 as note_off. Time deltas are
+# rounded to the nearest step of step_ticks. Velocities are compared in
+# velocity_buckets equal ranges, or not at all if None
+def encode_intervals(rows, extras, step_ticks, velocity_buckets=None):
+    keys = key_columns(rows, extras)
+    keys[:, 6] = np.floor(keys[:, 6] / step_ticks + 0.5)
+    notes = (keys[:, 0] == events.NOTE_ON) | (keys[:, 0] == events.NOTE_OFF)
+    keys[notes & (keys[:, 3] == 0), 0] = events.NOTE_OFF
+    after_note = np.concatenate([[False], notes[:-1]])
+    intervals = keys[:, 2] - np.concatenate([[0], keys[:-1, 2]])
+    keys[:, 2] = np.where(notes & after_note, intervals, keys[:, 2])
+    if velocity_buckets is None:
+        keys[notes, 3] = 0
+    else:
+        keys[:, 3] = np.where(keys[:, 0] == events.NOTE_ON,
+                              keys[:, 3] * velocity_buckets // 128, 0)
+    return number_rows(np.column_stack([keys, notes & after_note]))
+
+
+# finds the same repeats as find_repeats, in the same order, in a stream of
+# event arrays read in turn, so only a window of rows is held at a time rather
+# than the whole message list. The repeats at block_size offsets are found
+# together, with the two rows before them and the 2 * upper_wavelength rows
+# after them that they may match. Rows are compared by the integers encode
+# returns for them, which may depend on the row before. max_ticks is the
+# longest span of time deltas searched, if given. Yields (offset, wavelength,
+# matched, rows of the repeat)
+def stream_repeats(chunks, extras, lower_wavelength, upper_wavelength,
+                   maximal=False, max_ticks=None, encode=encode_window,
+                   block_size=BLOCK_SIZE):
+    lower_wavelength = max(lower_wavelength, 1)
+    if lower_wavelength >= upper_wavelength:
+        return
+    wavelengths = np.arange(lower_wavelength, upper_wavelength)
+    chunks = iter(chunks)
+    window = np.empty(0, dtype=events.EVENT_DTYPE)
+    # offset of the first row searched, and the number of rows before it
+    # kept in the window
+    start = 0
+    before = 0
+    done = False
+    while not done or len(window) > before:
+        while not done and len(window) < before + block_size + 2 * upper_wavelength:
+            rows = next(chunks, None)
+            if rows is None:
+                done = True
+            else:
+                window = np.concatenate([window, rows])
+        end = len(window) if done else before + block_size
+
+        # equal[r, k] is whether the row at r repeats wavelengths[k] rows
+        # later, for the block and the rows its repeats may run into
+        codes = encode(window[:end + 2 * upper_wavelength], extras)
+        height = min(len(codes), end + upper_wavelength)
+        padded = np.concatenate([codes, np.full(upper_wavelength, -1)])
+        later = np.lib.stride_tricks.sliding_window_view(padded, upper_wavelength)
+        equal = later[:height, lower_wavelength:] == codes[:height, None]
+
+        # number of consecutive repeating rows from each row, counted up to
+        # the first that does not repeat at the same wavelength
+        index = np.arange(height)[:, None]
+        stops = np.where(equal, height, index)
+        run = np.minimum.accumulate(stops[::-1], axis=0)[::-1] - index
+
+        found = equal[before:end].copy()
+        if maximal and before:
+            found &= ~equal[before-1:end-1]
+        elif maximal:
+            found[1:] &= ~equal[:end-1]
+        if max_ticks is not None:
+            limits = wavelength_limits(window['delta'][:height], max_ticks)
+            found &= wavelengths[None, :] <= limits[before:end, None]
+        found, k = np.nonzero(found)
+        found += before
+        lengths = wavelengths[k]
+        matched = np.minimum(run[found, k], lengths)
+        for r, wavelength, m in zip(found.tolist(), lengths.tolist(), matched.tolist()):
+            yield start + r - before, wavelength, m, window[r:r+wavelength]
+
+        start += end - before
+        before = min(end, 2)
+        window = window[end-before:]
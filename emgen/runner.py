@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import traceback
+from functools import partial, lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from . import metrics
+from . import pack
+
+
+# returns (K, N) from a K/N shard argument, K from 0 to N-1
+def shard_argument(text):
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('shard must be given as K/N, e.g. 0/4')
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('shard K/N needs N of at least 1 and K from 0 to N-1')
+    return index, count
+
+
+# returns a command line argument as an integer of at least 1
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%r is not a whole number' % text)
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, got %d' % value)
+    return value
+
+
+# adds the --jobs argument shared by every stage to an argument parser
+def add_arguments(parser):
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+                        help="Number of worker processes to spread files across. (Defaults to 1 if not specified)")
+
+
+# adds the --shard argument shared by every stage reading a folder of files
+def add_shard_arguments(parser):
+    parser.add_argument('-sh', '--shard', default=None, type=shard_argument,
+                        help="Process only shard K of N, given as K/N with K from 0 to N-1. Files are split between shards by a hash of their path within the input directory, so each node or process running a shard of the same input picks the same files. Each shard writes its own manifest, metadata index, metrics and errors, combined with emgen merge. (Every file processed if not specified)")
+
+
+# returns shard from 0 to count-1 of a file, by a hash of its path relative
+# to the input directory, so it does not depend on where the input is mounted.
+# A file within a packed corpus is in the same shard as it was unpacked
+def shard_of(filepath, input_dir, count):
+    relative = pack.relative(filepath, input_dir)
+    digest = hashlib.blake2b(relative.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+# returns the files of a list in shard (K, N), or all of them if shard is None
+def shard_files(files, input_dir, shard):
+    if shard is None:
+        return files
+    index, count = shard
+    return [filepath for filepath in files if shard_of(filepath, input_dir, count) == index]
+
+
+# returns name with the shard added, e.g. tile.0-of-4, for the manifest,
+# index, metrics and errors files a shard writes, or name if shard is None
+def shard_name(name, shard):
+    if shard is None:
+        return name
+    return '%s.%d-of-%d' % ((name,) + tuple(shard))
+
+
+# returns value of a stage argument from a dict of parsed arguments,
+# or the parser default if it was not given
+def argument(parser, params, name):
+    return params[name] if name in params else parser.get_default(name)
+
+
+# returns the GM instruments list used to name folders and files, read from
+# the package data on first use and kept for the life of the process
+@lru_cache(maxsize=None)
+def load_instruments():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GM_instruments.txt'), 'r') as f:
+        return f.read().split('\n')
+
+
+# seconds between progress lines printed by run
+PROGRESS_INTERVAL = 30
+
+
+# calls function on a file, returns (file, result, error message, metrics
+# recorded while it ran). Time not spent in the parse, validate or write
+# steps timed by the function is counted as transform
+def call(function, filepath):
+    try:
+        with metrics.timed('transform'):
+            result, error = function(filepath), None
+    except Exception:
+        result, error = None, traceback.format_exc()
+    return filepath, result, error, metrics.take()
+
+
+# prints a progress line for a stage if PROGRESS_INTERVAL has passed since
+# the last one, returns time of the last line printed
+def progress(stage, done, total, errors, started, last, unit='files'):
+    now = time.time()
+    if stage is None or now - last < PROGRESS_INTERVAL:
+        return last
+    print('%s: %d/%d %s, %.1f %s/s, %d errors' % (
+        stage, done, total, unit, done / (now - started), unit, errors))
+    return now
+
+
+# runs function over every file, in worker processes when jobs > 1, and yields
+# (file, result) in input order as results stream back. Exceptions raised for
+# a file are appended to errors as (file, traceback) instead of ending the run.
+# initializer is called with initargs in each worker before any file is passed.
+# Metrics recorded for each file are merged into the run totals, and a
+# progress line is printed every PROGRESS_INTERVAL seconds if stage is given.
+# unit names what is passed to function in the <unit>_processed and
+# <unit>_errored counters and the progress line, e.g. batches
+def run(function, files, jobs=1, errors=None, executor=ProcessPoolExecutor,
+        initializer=None, initargs=(), stage=None, unit='files'):
+    if errors is None:
+        errors = []
+    started = last = time.time()
+    if jobs > 1:
+        chunksize = max(1, min(64, len(files) // (jobs * 4)))
+        pool = executor(max_workers=jobs, initializer=initializer, initargs=initargs)
+        results = pool.map(partial(call, function), files, chunksize=chunksize)
+    else:
+        pool = None
+        results = (call(function, filepath) for filepath in files)
+    try:
+        for done, (filepath, result, error, recorded) in enumerate(results, 1):
+            metrics.merge(recorded)
+            metrics.count(unit+'_processed')
+            if error is not None:
+                metrics.count(unit+'_errored')
+                errors.append((filepath, error))
+            else:
+                yield filepath, result
+            last = progress(stage, done, len(files), len(errors), started, last, unit)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+# writes collected errors to <stage>_errors.jsonl in the output directory
+# and prints a one line summary
+def report_errors(errors, output_dir, stage):
+    if not errors:
+        return
+    error_path = output_dir+'/%s_errors.jsonl' % stage
+    with open(error_path, 'w') as f:
+        for filepath, error in errors:
+            f.write(json.dumps({'file': filepath, 'error': error})+'\n')
+    print('%d files failed in %s, see %s' % (len(errors), stage, error_path))
@@ -0,0 +1,160 @@
+import io
+import os
+import json
+import mmap
+from pathlib import Path
+try:
+    import fcntl
+except ImportError:
+    # no file locking on Windows, where packed output should use --jobs 1
+    fcntl = None
+
+# separates the shard path from the key of a packed output name
+SEPARATOR = '::'
+
+
+# adds the --packed argument shared by word.py, tile.py and pipeline.py
+def add_arguments(parser):
+    parser.add_argument('-p', '--packed', action='store_true',
+                        help="Append words and tiles to one packed shard per instrument, with an index of their offsets, instead of saving a MIDI and JSON file for each. (Separate files saved if not specified)")
+
+
+# returns paths of the shard and its index for an instrument in directory
+def shard_paths(directory, instrument):
+    return directory+instrument+'.shard', directory+instrument+'.index.jsonl'
+
+
+# shard and index files opened for appending by this process, by shard path
+writers = {}
+
+# a worker forked after the parent opened a shard, e.g. to mark outputs
+# removed, opens its own files, as an inherited file shares the parent's lock
+# and offset with every other worker
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=writers.clear)
+
+
+# returns open (shard, index) files for a shard path, creating them if needed
+def writer(shard_path, index_path):
+    if shard_path not in writers:
+        Path(os.path.dirname(shard_path)).mkdir(parents=True, exist_ok=True)
+        writers[shard_path] = (open(shard_path, 'ab'), open(index_path, 'a'))
+    return writers[shard_path]
+
+
+# appends index entry, and data to the shard if given, holding a lock on the
+# shard so worker processes writing the same instrument do not interleave
+def append(shard_path, index_path, entry, data=None):
+    shard, index = writer(shard_path, index_path)
+    if fcntl is not None:
+        fcntl.flock(shard.fileno(), fcntl.LOCK_EX)
+    try:
+        if data is not None:
+            shard.seek(0, os.SEEK_END)
+            entry['start'] = shard.tell()
+            entry['length'] = len(data)
+            shard.write(data)
+            shard.flush()
+        index.write(json.dumps(entry)+'\n')
+        index.flush()
+    finally:
+        if fcntl is not None:
+            fcntl.flock(shard.fileno(), fcntl.LOCK_UN)
+
+
+# returns the packed output name, recorded in the stage manifest, of the
+# entry for a metadata dict in the shard of an instrument in directory
+def output_name(directory, instrument, metadata):
+    shard_path = shard_paths(directory, instrument)[0]
+    return SEPARATOR.join([shard_path, '%d_%d' % (metadata['offset'], metadata['wavelength']),
+                           metadata['file']])
+
+
+# appends SMF data to the shard of an instrument in directory, indexed by the
+# source file, offset and wavelength in its metadata dict. Returns the packed
+# output name
+def write(directory, instrument, metadata, data):
+    shard_path, index_path = shard_paths(directory, instrument)
+    entry = {'file': metadata['file'], 'offset': metadata['offset'],
+             'wavelength': metadata['wavelength'], 'metadata': metadata}
+    append(shard_path, index_path, entry, data)
+    return output_name(directory, instrument, metadata)
+
+
+# returns True if an output name refers to an entry in a packed shard
+def is_packed(output):
+    return SEPARATOR in output
+
+
+# marks a packed output as removed in the index of its shard. The data stays
+# in the shard, readers skip it
+def remove(output):
+    shard_path, key, filepath = output.split(SEPARATOR, 2)
+    if not os.path.exists(shard_path):
+        return
+    offset, wavelength = key.split('_')
+    index_path = shard_path[:-len('.shard')]+'.index.jsonl'
+    append(shard_path, index_path, {'file': filepath, 'offset': int(offset),
+                                    'wavelength': int(wavelength), 'removed': True})
+
+
+# Read access to one shard. The shard is memory-mapped and its index loaded
+# into a dict, giving random access to each MIDI file by (source file,
+# offset, wavelength). Later index entries replace earlier ones for a key
+class ShardReader:
+
+    def __init__(self, shard_path):
+        self.path = shard_path
+        self.index = {}
+        with open(shard_path[:-len('.shard')]+'.index.jsonl', 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line of a run that was interrupted while writing
+                    continue
+                key = (entry['file'], entry['offset'], entry['wavelength'])
+                if entry.get('removed'):
+                    self.index.pop(key, None)
+                else:
+                    self.index[key] = entry
+        self.file = open(shard_path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0,
+                              access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    # returns list of (source file, offset, wavelength) keys in the shard
+    def keys(self):
+        return list(self.index)
+
+    # returns metadata dict of an entry
+    def metadata(self, filepath, offset, wavelength):
+        return self.index[(filepath, offset, wavelength)]['metadata']
+
+    # returns the SMF bytes of an entry
+    def read(self, filepath, offset, wavelength):
+        entry = self.index[(filepath, offset, wavelength)]
+        return self.data[entry['start']:entry['start']+entry['length']]
+
+    # returns an entry as a MidiFile. mido is imported here, so stages that
+    # only write shards or manifests do not load it
+    def midifile(self, filepath, offset, wavelength):
+        from mido import MidiFile
+        return MidiFile(file=io.BytesIO(self.read(filepath, offset, wavelength)))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+# returns dict of instrument name to ShardReader for every shard in directory
+def open_shards(directory):
+    return {path.name[:-len('.shard')]: ShardReader(str(path))
+            for path in sorted(Path(directory).glob('*.shard'))}
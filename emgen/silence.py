@@ -0,0 +1,40 @@
+import numpy as np
+
+
+# returns number of distinct notes sounding after each message, from arrays
+# of note numbers and note on flags. A note sounds from its latest note on
+# until its latest note off, so repeated ons or offs of a note count once
+def polyphony(notes, is_on):
+    order = np.argsort(notes, kind='stable')
+    state = is_on[order].astype(np.int64)
+    # state of the same note before each message, off before its first one
+    previous = np.zeros_like(state)
+    previous[1:] = state[:-1]
+    sorted_notes = notes[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_notes[1:] != sorted_notes[:-1]
+    previous[first] = 0
+    change = np.empty_like(state)
+    change[order] = state - previous
+    return np.cumsum(change)
+
+
+# returns boolean array flagging each message that leaves every note off and
+# is followed by silence. gaps holds the length in seconds of the silence
+# around each message, only gaps above minimum_silence count
+def silent_ends(notes, is_on, gaps, minimum_silence):
+    return ~is_on & (polyphony(notes, is_on) == 0) & (gaps > minimum_silence)
+
+
+# returns list of (start, end) index ranges of the words between silences.
+# A word starts after a message followed by silence when the time delta
+# before it, in seconds in leads, is above minimum_silence, and ends with the
+# next message followed by silence, or the last message
+def word_ranges(ends, leads, minimum_silence):
+    n = len(ends)
+    # the first message follows the last, as words have always been searched
+    starts = np.flatnonzero(np.roll(ends, 1) & (leads > minimum_silence))
+    end_positions = np.flatnonzero(ends)
+    stops = np.append(end_positions + 1, n)[
+        np.searchsorted(end_positions, starts)]
+    return list(zip(starts.tolist(), stops.tolist()))
@@ -0,0 +1,375 @@
+import mmap
+import struct
+import numpy as np
+from mido import Message, MetaMessage
+from mido.midifiles.meta import build_meta_message, encode_variable_int, meta_charset
+from . import events
+from . import pack
+
+# Reads and writes Standard MIDI Files straight from and to event arrays,
+# for the messages left by data_cleanse.py: note_on, note_off and
+# program_change, and set_tempo, time_signature, key_signature and
+# end_of_track meta messages. Other channel and meta messages are decoded by
+# mido one at a time, and files this reader does not handle at all (sysex,
+# broken chunks) are left to mido entirely, so results are the same as
+# events.from_midifile(MidiFile(filepath)) and EventTable.save
+
+# number of rows in each event array read by stream
+CHUNK_SIZE = 4096
+
+# longest meta message mido reads
+MAX_MESSAGE_LENGTH = 1000000
+
+# status byte of each channel message type written from columns
+STATUS_BYTES = {events.NOTE_ON: 0x90, events.NOTE_OFF: 0x80,
+                events.PROGRAM_CHANGE: 0xc0}
+
+# number of data bytes after the status byte of each channel message
+DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xa0: 2, 0xb0: 2, 0xc0: 1, 0xd0: 1, 0xe0: 2}
+
+# bytes of the key_signature meta message for each index into KEY_NAMES
+KEY_BYTES = [bytes(MetaMessage('key_signature', key=key).bytes())
+             for key in events.KEY_NAMES]
+
+
+# raised by read_track for track data holding anything only mido reads
+class Unhandled(Exception):
+    pass
+
+
+# yields event arrays of up to chunk_size rows of the track chunk between pos
+# and end of SMF data, all of it in one array if chunk_size is None, appending
+# messages stored as OTHER to extras. Raises Unhandled if the track holds
+# anything only mido reads
+def read_track(data, pos, end, extras, chunk_size=None):
+    values = []
+    append = values.append
+    status = None
+    tick = 0
+    while pos < end:
+        if len(values) == chunk_size:
+            rows = to_rows(values, tick)
+            tick = int(rows['tick'][-1])
+            yield rows
+            values = []
+            append = values.append
+
+        byte = data[pos]
+        pos += 1
+        delta = byte & 0x7f
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            delta = delta << 7 | byte & 0x7f
+
+        byte = data[pos]
+        if byte == 0xff:
+            meta_type = data[pos+1]
+            pos += 2
+            byte = data[pos]
+            pos += 1
+            size = byte & 0x7f
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                size = size << 7 | byte & 0x7f
+            if size > MAX_MESSAGE_LENGTH:
+                raise Unhandled()
+            body = data[pos:pos+size]
+            pos += size
+            if meta_type == 0x51 and size == 3:
+                append((events.SET_TEMPO, -1, -1, -1, -1,
+                        body[0] << 16 | body[1] << 8 | body[2], delta))
+            elif meta_type == 0x58 and size == 4:
+                append((events.TIME_SIGNATURE, -1, -1, -1, -1,
+                        body[0] | body[1] << 8 | body[2] << 16 | body[3] << 24, delta))
+            elif meta_type == 0x2f and size == 0:
+                append((events.END_OF_TRACK, -1, -1, -1, -1, 0, delta))
+            elif meta_type == 0x59 and size == 2 and body[1] < 2 and (
+                    body[0] <= 7 or body[0] >= 249):
+                sharps = body[0] - 256 if body[0] > 127 else body[0]
+                append((events.KEY_SIGNATURE, -1, -1, -1, -1,
+                        body[1] * 15 + sharps + 7, delta))
+            else:
+                with meta_charset('latin1'):
+                    msg = build_meta_message(meta_type, list(body), delta)
+                append(events.message_row(msg, extras)[:7])
+            continue
+
+        # running status, the byte read is the first data byte
+        if byte < 0x80:
+            if status is None:
+                raise Unhandled()
+        elif byte >= 0xf0:
+            raise Unhandled()
+        else:
+            status = byte
+            pos += 1
+        kind = status & 0xf0
+        channel = status & 0x0f
+        if kind == 0x90 or kind == 0x80:
+            note = data[pos]
+            velocity = data[pos+1]
+            pos += 2
+            if note > 127 or velocity > 127:
+                raise Unhandled()
+            append((events.NOTE_ON if kind == 0x90 else events.NOTE_OFF,
+                    channel, note, velocity, -1, 0, delta))
+        elif kind == 0xc0:
+            program = data[pos]
+            pos += 1
+            if program > 127:
+                raise Unhandled()
+            append((events.PROGRAM_CHANGE, channel, -1, -1, program, 0, delta))
+        else:
+            size = DATA_LENGTHS[kind]
+            body = list(data[pos:pos+size])
+            pos += size
+            if len(body) < size or max(body) > 127:
+                raise Unhandled()
+            append((events.OTHER, channel, -1, -1, -1, len(extras), delta))
+            extras.append(Message.from_bytes([status] + body, time=delta))
+    if pos != end:
+        raise Unhandled()
+    yield to_rows(values, tick)
+
+
+# returns event array of (type, channel, note, velocity, program, data, delta)
+# tuples, with absolute ticks counted on from tick
+def to_rows(values, tick=0):
+    columns = np.array(values, dtype=np.int64).reshape(-1, 7)
+    rows = np.zeros(len(columns), dtype=events.EVENT_DTYPE)
+    for i, name in enumerate(['type', 'channel', 'note', 'velocity', 'program', 'data', 'delta']):
+        rows[name] = columns[:, i]
+    rows['tick'] = tick + np.cumsum(rows['delta'])
+    return rows
+
+
+# returns event array of the track chunk between start and end of SMF data,
+# appending messages stored as OTHER to extras. Returns None if the track
+# holds anything only mido reads
+def decode_track(data, pos, end, extras):
+    try:
+        return next(read_track(data, pos, end, extras))
+    except Unhandled:
+        return None
+
+
+# returns (type, ticks_per_beat, list of (start, end) of each track chunk's
+# data) of SMF data, or None if it is not laid out as this reader expects
+def read_header(data):
+    if data[:4] != b'MThd':
+        return None
+    size = struct.unpack('>L', data[4:8])[0]
+    if size < 6:
+        return None
+    smf_type, track_count, ticks_per_beat = struct.unpack('>hhh', data[8:14])
+    pos = 8 + size
+    bounds = []
+    for _ in range(track_count):
+        if data[pos:pos+4] != b'MTrk':
+            return None
+        end = pos + 8 + struct.unpack('>L', data[pos+4:pos+8])[0]
+        if end > len(data):
+            return None
+        bounds.append((pos + 8, end))
+        pos = end
+    return smf_type, ticks_per_beat, bounds
+
+
+# returns EventTable of SMF data, or None if it holds anything only mido reads
+def decode(data):
+    try:
+        header = read_header(data)
+        if header is None:
+            return None
+        smf_type, ticks_per_beat, bounds = header
+        extras = []
+        tracks = []
+        for start, end in bounds:
+            rows = decode_track(data, start, end, extras)
+            if rows is None:
+                return None
+            tracks.append(rows)
+    except Exception:
+        # truncated or broken data, left to mido to report
+        return None
+    return events.EventTable(tracks, ticks_per_beat, extras, smf_type)
+
+
+# loads file path as EventTable, as events.load does. A file within a packed
+# corpus is decoded from a view of the corpus, without copying it
+def load(filepath):
+    data = pack.read(filepath)
+    table = decode(data)
+    if table is None:
+        table = events.load(filepath)
+    return table
+
+
+# reads file path in two passes over a memory map, for files too long to hold
+# as event arrays. Returns (summary, chunks): summary is an EventTable of the
+# first track, with only the set_tempo rows and the first program_change row
+# of each other track, so its tempo map and program change are those of the
+# whole file. chunks yields event arrays of up to chunk_size rows of the
+# other tracks in turn, appending messages stored as OTHER to the extras of
+# summary. Files this reader does not handle are loaded whole by mido, their
+# EventTable returned as the summary
+def stream(filepath, chunk_size=CHUNK_SIZE):
+    data = None
+    try:
+        if pack.is_member(filepath):
+            # a view of the corpus map, left open for other files
+            data = pack.read(filepath)
+        else:
+            with open(filepath, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = read_header(data)
+        if header is None:
+            raise Unhandled()
+        smf_type, ticks_per_beat, bounds = header
+        extras = []
+        tracks = []
+        for i, (start, end) in enumerate(bounds):
+            if i == 0:
+                tracks.append(next(read_track(data, start, end, extras)))
+                continue
+            kept = []
+            found = False
+            for rows in read_track(data, start, end, [], chunk_size):
+                keep = rows['type'] == events.SET_TEMPO
+                if not found:
+                    changes = np.flatnonzero(rows['type'] == events.PROGRAM_CHANGE)
+                    if len(changes):
+                        keep[changes[0]] = True
+                        found = True
+                kept.append(rows[keep])
+            tracks.append(np.concatenate(kept))
+    except Exception:
+        # empty, truncated or broken data, left to mido to read or report
+        if isinstance(data, mmap.mmap):
+            data.close()
+        table = events.load(filepath)
+        return table, iter(table.tracks[1:])
+
+    def chunks():
+        try:
+            for start, end in bounds[1:]:
+                yield from read_track(data, start, end, extras, chunk_size)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    return events.EventTable(tracks, ticks_per_beat, extras, smf_type), chunks()
+
+
+# returns event array as mido writes it: end_of_track rows removed, their
+# time deltas added to the next row, and one end_of_track row added at the end
+def fix_end_of_track(rows):
+    ticks = np.cumsum(rows['delta'])
+    keep = rows['type'] != events.END_OF_TRACK
+    kept = rows[keep]
+    kept_ticks = ticks[keep]
+    kept['delta'] = np.diff(kept_ticks, prepend=0)
+    end = events.make_row(events.END_OF_TRACK, delta=(
+        ticks[-1] if len(ticks) else 0) - (kept_ticks[-1] if len(kept_ticks) else 0))
+    fixed = np.concatenate([kept, end])
+    fixed['tick'] = np.cumsum(fixed['delta'])
+    return fixed
+
+
+# returns bytes of the message of an OTHER or time_signature row, as mido
+# writes them after the time delta
+def message_bytes(code, data, extras):
+    if code == events.TIME_SIGNATURE:
+        return bytes(events.unpack_time_signature(data, 0).bytes())
+    msg = extras[data]
+    if msg.is_meta:
+        return bytes(msg.bytes())
+    if msg.is_realtime:
+        raise ValueError('realtime messages are not allowed in MIDI files')
+    if msg.type == 'sysex':
+        return bytes([0xf0] + encode_variable_int(len(msg.data) + 1) + list(msg.data) + [0xf7])
+    return bytes(msg.bytes())
+
+
+# appends a time delta to bytearray out as a variable length integer
+def write_delta(out, delta):
+    if delta < 0:
+        raise ValueError('message time must be non-negative in MIDI file')
+    if delta < 0x80:
+        out.append(delta)
+    else:
+        out += bytes(encode_variable_int(delta))
+
+
+# returns the data of a track chunk holding an event array, the same bytes
+# mido writes for the same messages. As in mido, end_of_track rows are left
+# out and their time deltas added to the next row, one end_of_track is
+# written at the end, and the status byte of a channel message is left out
+# when the one before set the same running status
+def encode_track(rows, extras):
+    out = bytearray()
+    running = None
+    carried = 0
+    for code, channel, note, velocity, program, data, delta, tick, seconds in rows.tolist():
+        if code == events.END_OF_TRACK:
+            carried += delta
+            continue
+        write_delta(out, delta + carried)
+        carried = 0
+
+        if code == events.NOTE_ON or code == events.NOTE_OFF or code == events.PROGRAM_CHANGE:
+            status = STATUS_BYTES[code] | channel
+            if status != running:
+                out.append(status)
+                running = status
+            if code == events.PROGRAM_CHANGE:
+                out.append(program)
+            else:
+                out.append(note)
+                out.append(velocity)
+        elif code == events.SET_TEMPO:
+            out += bytes((0xff, 0x51, 3, data >> 16, data >> 8 & 0xff, data & 0xff))
+            running = None
+        elif code == events.KEY_SIGNATURE:
+            out += KEY_BYTES[data]
+            running = None
+        else:
+            message = message_bytes(code, data, extras)
+            status = message[0]
+            if status < 0xf0:
+                if status == running:
+                    message = message[1:]
+                running = status
+            else:
+                running = None
+            out += message
+    write_delta(out, carried)
+    out += b'\xff\x2f\x00'
+    return bytes(out)
+
+
+# returns SMF data holding a list of event arrays, the same bytes MidiFile.save
+# writes for the same messages
+def encode(tracks, ticks_per_beat, extras, type=1):
+    if type == 0 and len(tracks) != 1:
+        raise ValueError('type 0 file must have exactly 1 track')
+    chunks = [struct.pack('>4sLhhh', b'MThd', 6, type, len(tracks), ticks_per_beat)]
+    with meta_charset('latin1'):
+        for rows in tracks:
+            data = encode_track(rows, extras)
+            chunks.append(struct.pack('>4sL', b'MTrk', len(data)))
+            chunks.append(data)
+    return b''.join(chunks)
+
+
+# saves a list of event arrays to file path as a MIDI file
+def write(filepath, tracks, ticks_per_beat, extras, type=1):
+    data = encode(tracks, ticks_per_beat, extras, type)
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+
+# saves EventTable to file path, as EventTable.save does
+def save(table, filepath):
+    write(filepath, table.tracks, table.ticks_per_beat, table.extras, table.type)
@@ -0,0 +1,108 @@
+import os
+import struct
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from . import runner
+from . import pack
+from . import manifest
+from . import metrics
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take a folder of MIDI files, filter those of Type 1 SMF, and copy to a new directory'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+parser.add_argument('-j', '--jobs', '-t', '--threads', dest='jobs', default=16, type=int,
+                    help="Number of threads reading and copying files at the same time. (Defaults to 16 if not specified)")
+runner.add_shard_arguments(parser)
+manifest.add_arguments(parser)
+
+
+# stores stage arguments as module variables. Takes dict of argument values,
+# parser defaults are used for any not given
+def configure(params):
+    global output_dir, new_dir, manifest_path
+    output_dir = runner.argument(parser, params, 'output')
+    new_dir = output_dir+'/type_1/'
+    manifest_path = output_dir+'/%s.jsonl' % runner.shard_name(
+        'type_1_manifest', runner.argument(parser, params, 'shard'))
+
+
+configure({})
+
+
+# parses the 14 byte MThd chunk at the start of a file, returns a tuple
+# of (format, number of tracks, division) or None if not a standard MIDI file
+def parse_header(header):
+    if len(header) < 14 or header[:4] != b'MThd':
+        return None
+    length, smf_format, tracks, division = struct.unpack('>IHHH', header[4:14])
+    if length < 6:
+        return None
+    return smf_format, tracks, division
+
+
+# reads the MThd chunk of file passed as parameter
+def read_header(filepath):
+    return parse_header(pack.read(filepath, 14))
+
+
+# filters type 1 SMF files
+def is_type1(filepath):
+    header = read_header(filepath)
+    return header is not None and header[0] == 1
+
+
+# reads header of file, copies it if type 1, returns header fields
+# and copy decision for the manifest entry
+def scan(filepath):
+    entry = {'type': None, 'tracks': None, 'division': None, 'copied': False}
+    try:
+        with metrics.timed('parse'):
+            header = read_header(filepath)
+        if header is not None:
+            entry['type'], entry['tracks'], entry['division'] = header
+        if entry['type'] == 1:
+            with metrics.timed('write'):
+                pack.copy(filepath, new_dir)
+            entry['copied'] = True
+            metrics.count('files_copied')
+        else:
+            metrics.count('files_invalid')
+    except OSError:
+        metrics.count('files_invalid')
+    return entry
+
+
+# add all file paths to list, pass each through scan() on a thread pool
+# and record header fields of every file in the manifest
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    configure(params)
+    input_dir = params['input']
+    jobs = params['jobs']
+    stage = runner.shard_name('smf_type1', params['shard'])
+    Path(new_dir).mkdir(parents=True, exist_ok=True)
+
+    smf1 = pack.files(input_dir, recursive=False)
+    smf1 = runner.shard_files(smf1, input_dir, params['shard'])
+    stage_manifest = manifest.Manifest(manifest_path, {})
+    todo = stage_manifest.pending(smf1, params['force'])
+    errors = []
+    for file, entry in runner.run(scan, todo, jobs, errors, executor=ThreadPoolExecutor,
+                                  initializer=configure, initargs=(params,), stage=stage):
+        outputs = [new_dir+os.path.basename(file)] if entry['copied'] else []
+        stage_manifest.record(file, outputs, **entry)
+    stage_manifest.close()
+    runner.report_errors(errors, output_dir, stage)
+    metrics.report(output_dir, stage)
+
+
+if __name__ == '__main__':
+    main()
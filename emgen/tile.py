@@ -0,0 +1,413 @@
+from mido import MetaMessage
+import numpy as np
+from pathlib import Path
+import json
+import argparse
+import os
+from . import events
+from . import runner
+from . import pack
+from . import manifest
+from . import shards
+from . import metadata
+from . import metrics
+from . import cache
+from . import smf
+from . import writer
+from functools import partial
+from .repeats import encode_rows, encode_window, encode_intervals, find_repeats, stream_repeats, wavelength_limits, canonical_hash, extra_keys
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take a folder of source-separated and cleaned MIDI files, search for repeated messages over a series of wavelengths, and save to new files within separate instrument directories. Make sure data is passed through emgen type1, emgen isolate and emgen cleanse first to ensure input set is all SMF Type 1, source separated and in the correct format'
+)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+parser.add_argument('-lw', '--lower_wavelength', default=5, type=int,
+                    help="Lower boundary of the tile wavelength, i.e. the lowest number of messages that a tile can have. (Defaults to 5 if not specified)")
+parser.add_argument('-uw', '--upper_wavelength', default=200, type=int,
+                    help="Upper boundary of the tile wavelength, i.e. the highest number of messages that a tile can have. (Defaults to 200 if not specified)")
+parser.add_argument('-tl', '--tile_limit', default=None, type=int,
+                    help="Upper boundary of number of tiles per file passed. (No limit applied if not specified)")
+parser.add_argument('-mt', '--maximum_time', default=30, type=int,
+                    help="Upper boundary of the time in seconds that a tile may be. (Defaults to 30 seconds if not specified)")
+parser.add_argument('-dd', '--dedup', action='store_true',
+                    help="Save one copy of tiles with the same messages across all files, recording the others in the metadata index as references to it. (Every tile saved if not specified)")
+parser.add_argument('-mx', '--maximal', action='store_true',
+                    help="Save only maximal repeats, leaving out those contained in a longer repeat at the same wavelength, and stop searching longer wavelengths at each offset once the messages last longer than the maximum time. (Every repeat saved if not specified)")
+parser.add_argument('-mm', '--matching', default='exact', choices=['exact', 'interval'],
+                    help="How messages are compared when searching for repeats. exact compares every value, interval compares notes by their pitch interval from the message before, with time deltas rounded to the quantize steps and velocities compared by bucket, so phrases played higher, lower or slightly off the beat repeat. (Defaults to exact if not specified)")
+parser.add_argument('-qs', '--quantize_steps', default=4, type=runner.positive_int,
+                    help="Number of steps per beat that time deltas are rounded to with interval matching. (Defaults to 4 if not specified)")
+parser.add_argument('-vb', '--velocity_buckets', default=None, type=runner.positive_int,
+                    help="Number of equal velocity ranges that notes must share to match with interval matching. (Velocity not compared if not specified)")
+parser.add_argument('-st', '--streaming', action='store_true',
+                    help="Read each file a few thousand messages at a time and search a window of them at a time, adding tiles to the metadata index a batch at a time, so memory use does not grow with the number of messages. The paths of the tiles saved from each file are still held for its manifest entry, so memory grows with its number of tiles. The same tiles are saved. (Whole file read at once if not specified)")
+runner.add_arguments(parser)
+runner.add_shard_arguments(parser)
+shards.add_arguments(parser)
+cache.add_arguments(parser)
+writer.add_arguments(parser)
+manifest.add_arguments(parser)
+
+
+# stores stage arguments as module variables. Takes dict of argument values,
+# parser defaults are used for any not given
+def configure(params):
+    global output_dir, lower_wavelength, upper_wavelength, tile_limit, maximum_time, packed, dedup, maximal, streaming
+    global matching, quantize_steps, velocity_buckets, index_path
+    output_dir = runner.argument(parser, params, 'output')
+    index_path = metadata.index_path(output_dir, runner.argument(parser, params, 'shard'))
+    lower_wavelength = runner.argument(parser, params, 'lower_wavelength')
+    upper_wavelength = runner.argument(parser, params, 'upper_wavelength')
+    tile_limit = runner.argument(parser, params, 'tile_limit')
+    maximum_time = runner.argument(parser, params, 'maximum_time')
+    packed = runner.argument(parser, params, 'packed')
+    dedup = runner.argument(parser, params, 'dedup')
+    maximal = runner.argument(parser, params, 'maximal')
+    streaming = runner.argument(parser, params, 'streaming')
+    matching = runner.argument(parser, params, 'matching')
+    quantize_steps = runner.argument(parser, params, 'quantize_steps')
+    velocity_buckets = runner.argument(parser, params, 'velocity_buckets')
+    cache.configure(runner.argument(parser, params, 'cache_dir'))
+    writer.configure(runner.argument(parser, params, 'write_threads'))
+
+
+configure({})
+
+# number of tiles whose content hashes are claimed together with dedup, and
+# of index rows added together when streaming
+CLAIM_BATCH = 1024
+
+
+# returns first program change of EventTable passed as parameter,
+# as an event row with time delta of 0
+def find_program_change(table):
+    program, channel = cache.fact(table, 'program_change')
+    return events.make_row(events.PROGRAM_CHANGE, channel=channel, program=program)
+
+
+# returns tempo of EventTable passed as parameter
+def find_tempo(table):
+    return cache.fact(table, 'tempo')
+
+
+# returns the most ticks the messages of a tile may span and the tile last at
+# most maximum_time, at the fastest tempo of a tempo map. Tiles spanning more
+# are rejected by the length check, so are not searched for in maximal mode.
+# None if there is no such limit
+def longest_span(tmap, ticks_per_beat):
+    fastest = tmap[2].min()
+    if not maximal or fastest <= 0:
+        return None
+    return maximum_time * ticks_per_beat / (fastest * 1e-6)
+
+
+# returns the function encoding event rows as the integers compared in the
+# search for repeats, for a file of ticks_per_beat
+def row_encoder(ticks_per_beat):
+    if matching == 'interval':
+        return partial(encode_intervals, step_ticks=ticks_per_beat / quantize_steps,
+                       velocity_buckets=velocity_buckets)
+    return encode_window
+
+
+# yields event arrays read from chunks, with the seconds column set to the
+# time of each row counted from the first as if the arrays were one track,
+# as the whole file search does. Reading each array is timed as parsing
+def timed_chunks(chunks, tmap, ticks_per_beat):
+    tick = 0
+    while True:
+        with metrics.timed('parse'):
+            rows = next(chunks, None)
+        if rows is None:
+            return
+        metrics.count('messages_processed', len(rows))
+        ticks = tick + np.cumsum(rows['delta'])
+        rows['seconds'] = events.ticks_to_seconds(ticks, tmap, ticks_per_beat)
+        if len(ticks):
+            tick = ticks[-1]
+        yield rows
+
+
+# prints a tile that could not be saved
+def tile_error(filepath, length, tile_tracks, extras):
+    metrics.count('tiles_errored')
+    print('Error with tile creation for file: %s\nAttempted tile length %d' % (
+        filepath, length))
+    for msg in events.array_to_track(tile_tracks[0], extras):
+        print(msg)
+    print(
+        '\n____________________________________________________________________________________________________________________________________\n____________________________________________________________________________________________________________________________________\n\n')
+
+
+# create tiles from file passed by searching for repeated messages,
+# returns list of saved file paths
+def create_tiles(filepath, table=None):
+    instruments = runner.load_instruments()
+
+    global tile_limit
+    # check to see if tile limit has been set
+    if tile_limit is not None:
+        single_tile_limit = tile_limit
+
+    # paths of all files saved, returned for the stage manifest
+    outputs = []
+
+    # when streaming, read the header track and tempo map of the file, then
+    # the rows beyond the header track a chunk at a time as tiles are found
+    streamed = streaming and table is None
+    if streamed:
+        with metrics.timed('parse'):
+            table, chunks = smf.stream(filepath)
+        metrics.count('messages_processed', len(table.tracks[0]))
+        tmap = cache.fact(table, 'tempo_map')
+        tiles = stream_repeats(timed_chunks(chunks, tmap, table.ticks_per_beat),
+                               table.extras, lower_wavelength, upper_wavelength,
+                               maximal, longest_span(tmap, table.ticks_per_beat),
+                               row_encoder(table.ticks_per_beat))
+
+    else:
+        # store file as EventTable obj, unless already loaded by the caller
+        if table is None:
+            with metrics.timed('parse'):
+                table = cache.load(filepath)
+        metrics.count('messages_processed', sum(len(rows) for rows in table.tracks))
+
+        # all rows beyond header track, with accumulated time of each message
+        # index in seconds using the tempo map of the whole file
+        rows = np.concatenate(
+            [np.empty(0, dtype=events.EVENT_DTYPE)] + table.tracks[1:])
+        acc_time_index = np.cumsum(rows['delta'])
+        tmap = cache.fact(table, 'tempo_map')
+        rows['seconds'] = events.ticks_to_seconds(
+            acc_time_index, tmap, table.ticks_per_beat)
+
+        # find every offset/wavelength pair whose messages repeat, matching
+        # on integer codes rather than comparing Message objects one by one
+        if matching == 'interval':
+            codes = row_encoder(table.ticks_per_beat)(rows, table.extras).tolist()
+        else:
+            codes = encode_rows(rows, table.extras)
+        span = longest_span(tmap, table.ticks_per_beat)
+        limits = None if span is None else wavelength_limits(rows['delta'], span).tolist()
+        tiles = ((offset, wavelength, matched, rows[offset:offset+wavelength])
+                 for offset, wavelength, matched
+                 in find_repeats(codes, lower_wavelength, upper_wavelength, maximal, limits))
+
+    # header track rows copied into every tile, without end_of_track
+    header_rows = np.concatenate(
+        [np.empty(0, dtype=events.EVENT_DTYPE)] + table.tracks[:1])
+    header_rows = header_rows[header_rows['type'] != events.END_OF_TRACK]
+
+    # rows of every tile saved, for the metadata index. When streaming, rows of
+    # an earlier run over this file are removed first and rows are added a
+    # batch at a time rather than held until the end of the file
+    items = []
+    if streamed:
+        metadata.replace(index_path, 'tile', filepath, [])
+    header = metadata.header_fields(table)
+
+    # saved copy of each content hash seen in this file, when deduplicating.
+    # Hashes registered by an earlier run over this file are released first
+    claimed = {}
+    if dedup:
+        metadata.release(index_path, filepath)
+        keys = extra_keys(table.extras)
+
+    # tiles waiting to be saved until the content hashes of a batch of them
+    # are claimed together. With a tile limit, which duplicates are not
+    # charged against, or without dedup, each tile is saved at once
+    waiting = []
+    batch_size = CLAIM_BATCH if dedup and tile_limit is None else 1
+
+    # saves each waiting tile, or with dedup indexes it as a reference to the
+    # copy already saved from this or another file
+    def save_waiting():
+        nonlocal single_tile_limit
+        if dedup:
+            copies = {}
+            for tile_dict, tile, tile_tracks, extras, length, instrument, matched, mid_path, saved, digest in waiting:
+                if digest not in claimed:
+                    copies.setdefault(digest, saved)
+            claimed.update(metadata.claim(index_path, filepath, list(copies.items())))
+        for tile_dict, tile, tile_tracks, extras, length, instrument, matched, mid_path, saved, digest in waiting:
+            try:
+                duplicate = dedup and claimed[digest] != saved
+                if duplicate:
+                    saved = claimed[digest]
+                elif packed:
+                    # append tile to the packed shard of its instrument
+                    with metrics.timed('write'):
+                        outputs.append(shards.write(
+                            output_dir+'/tiles/', instruments[instrument], tile_dict,
+                            smf.encode(tile_tracks, table.ticks_per_beat, extras)))
+                else:
+                    # written in the background, directories created once
+                    with metrics.timed('write'):
+                        writer.write(mid_path, smf.encode(
+                            tile_tracks, table.ticks_per_beat, extras))
+                    outputs.append(mid_path)
+
+                    # print info to screen for development
+                    """
+                    print('\nFile name: %s' % filepath)
+                    for i, track in enumerate(tile_tracks):
+                        print('Track number: %d' % (i+1))
+                        for msg in events.array_to_track(track, extras):
+                            print(msg)
+                        print(
+                            '\n____________________________________________________________________________________________________________________________________\n')
+                    """
+
+                    try:
+                        # save json file
+                        json_dir = '/tile_metadata/' + \
+                            instruments[instrument]+'/'
+                        json_path = output_dir+json_dir+os.path.basename(mid_path)[:-4]+'.json'
+                        with metrics.timed('write'):
+                            writer.write(json_path, json.dumps(tile_dict).encode())
+                        outputs.append(json_path)
+                    except:
+                        print('JSON object not created for file: %s\n' %
+                              filepath)
+                        for msg in events.array_to_track(tile_tracks[0], extras):
+                            print(msg)
+                        print(
+                            '\n____________________________________________________________________________________________________________________________________\n____________________________________________________________________________________________________________________________________\n\n')
+
+                metrics.count('tiles_duplicate' if duplicate else 'tiles_emitted')
+
+                # add to the metadata index
+                items.append(metadata.item(
+                    'tile', tile_dict, tile, length,
+                    header, instrument, instruments[instrument], saved, digest, duplicate))
+
+                # dacrement tile limit for next loop, the limit is charged once
+                # for each repeating message so limited runs emit the same tiles.
+                # Duplicates are not charged
+                if tile_limit is not None and not duplicate:
+                    single_tile_limit -= min(matched, single_tile_limit)
+
+            except:
+                tile_error(filepath, length, tile_tracks, extras)
+        del waiting[:]
+
+        # when streaming, a batch of rows is added to the index once their
+        # files are written, and claims are forgotten, to be looked up in the
+        # index again if the same content is seen later in the file
+        if streamed and len(items) >= CLAIM_BATCH:
+            with metrics.timed('write'):
+                writer.flush()
+                metadata.add(index_path, items)
+            del items[:]
+            claimed.clear()
+
+    for offset, wavelength, matched, tile in tiles:
+        if tile_limit is not None:
+            if single_tile_limit == 0:
+                break
+
+        # music track holding the program change and the tile, timed alone
+        # to determine absolute time of tile for metadata
+        music_rows = np.concatenate([find_program_change(table), tile])
+
+        # save tile metadata to json formatted string
+        current_time = tile['seconds'][0]
+
+        tile_dict = {
+            'file': filepath,
+            'offset': offset,
+            'wavelength': wavelength,
+            'start_time_seconds': ('%.2f' % current_time),
+            'total_length_seconds': ('%.2f' % events.length([music_rows], table.ticks_per_beat))
+        }
+
+        # tracks of the tile file, a header track containing same info as
+        # original file with the tile metadata added as a text message, and
+        # the music track
+        extras = table.extras + [MetaMessage('text', text=str(tile_dict), time=0)]
+        tile_tracks = [np.concatenate([header_rows, events.make_row(events.OTHER, data=len(table.extras))]),
+                       music_rows]
+        with metrics.timed('validate'):
+            length = events.length(tile_tracks, table.ticks_per_beat)
+
+        try:
+            # save to new file if tile within valid time range
+            if length > 0 and length <= maximum_time:
+                file_name = os.path.basename(filepath)
+                instrument = int(music_rows['program'][0])
+                tile_dir = '/tiles/' + \
+                    instruments[instrument]+'/'
+                mid_path = output_dir+tile_dir+'%s_%s_%d_%d.mid' % (
+                    file_name[:-4], instruments[instrument], offset, wavelength)
+                saved = shards.output_name(
+                    output_dir+'/tiles/', instruments[instrument], tile_dict) if packed else mid_path
+
+                # with dedup, a tile already saved from this or another file
+                # is not saved again, only indexed as a reference to that copy
+                digest = canonical_hash(tile, keys, table.ticks_per_beat, instrument) if dedup else None
+                waiting.append((tile_dict, tile, tile_tracks, extras, length, instrument,
+                                matched, mid_path, saved, digest))
+                if len(waiting) >= batch_size:
+                    save_waiting()
+            else:
+                metrics.count('tiles_rejected')
+
+        except:
+            tile_error(filepath, length, tile_tracks, extras)
+    save_waiting()
+
+    # every tile file is written before the index and manifest list it
+    with metrics.timed('write'):
+        writer.flush()
+        if streamed:
+            metadata.add(index_path, items)
+        else:
+            metadata.replace(index_path, 'tile', filepath, items)
+    return outputs
+
+
+# add all file paths to list, pass each file through create_tiles()
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    configure(params)
+    input_dir = params['input']
+    jobs = params['jobs']
+    stage = runner.shard_name('tile', params['shard'])
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    newlist = pack.files(input_dir)
+    newlist = runner.shard_files(newlist, input_dir, params['shard'])
+    stage_params = {'lower_wavelength': params['lower_wavelength'],
+                    'upper_wavelength': params['upper_wavelength'],
+                    'tile_limit': params['tile_limit'],
+                    'maximum_time': params['maximum_time'],
+                    'packed': params['packed'],
+                    'dedup': params['dedup'],
+                    'maximal': params['maximal'],
+                    'matching': params['matching'],
+                    'quantize_steps': params['quantize_steps'],
+                    'velocity_buckets': params['velocity_buckets']}
+    stage_manifest = manifest.Manifest(
+        output_dir+'/%s.jsonl' % runner.shard_name('tiles_manifest', params['shard']), stage_params)
+    # with dedup, files holding references to copies saved from a changed
+    # file are processed again with it, as those copies are removed
+    todo = stage_manifest.pending(newlist, params['force'], dependents=partial(
+        metadata.referencing, index_path) if dedup else None)
+    errors = []
+    for file, outputs in runner.run(create_tiles, todo, jobs, errors,
+                                    initializer=configure, initargs=(params,),
+                                    stage=stage):
+        stage_manifest.record(file, outputs)
+    stage_manifest.close()
+    runner.report_errors(errors, output_dir, stage)
+    metrics.report(output_dir, stage)
+
+
+if __name__ == '__main__':
+    main()
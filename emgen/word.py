@@ -0,0 +1,289 @@
+from mido import MetaMessage
+import numpy as np
+from pathlib import Path
+import json
+import argparse
+import os
+from . import events
+from . import silence
+from . import runner
+from . import pack
+from . import manifest
+from . import shards
+from . import metadata
+from . import metrics
+from . import cache
+from . import smf
+from . import writer
+
+# argument parser for command line arguments
+parser = argparse.ArgumentParser(
+    description='Will take a folder of source-separated and cleaned MIDI files, search for passages of music surrounded by silence, and save to new files within separate instrument directories. Make sure data is passed through emgen type1, emgen isolate and emgen cleanse first to ensure input set is all SMF Type 1, source separated and in the correct format'
+)
+# add parameters you want to parse (positional / optional)
+parser.add_argument('-i', '--input', required=True,
+                    help="Path to input directory. (Required)")
+parser.add_argument('-o', '--output', default=os.getcwd(),
+                    help="Path to output directory. (Defaults to current working directory if not specified)")
+parser.add_argument('-ms', '--minimum_silence', default=0.5, type=float,
+                    help="Value in seconds of the silence gap significant enough to determine a word. (Defaults to 0.5 seconds if not specified)")
+parser.add_argument('-wl', '--word_limit', default=None, type=int,
+                    help="Upper boundary of number of words per file passed. (No limit applied if not specified)")
+parser.add_argument('-mt', '--maximum_time', default=10, type=int,
+                    help="Upper boundary of the time in seconds that a word may be. (Defaults to 10 seconds if not specified)")
+runner.add_arguments(parser)
+runner.add_shard_arguments(parser)
+shards.add_arguments(parser)
+cache.add_arguments(parser)
+writer.add_arguments(parser)
+manifest.add_arguments(parser)
+
+
+# stores stage arguments as module variables. Takes dict of argument values,
+# parser defaults are used for any not given
+def configure(params):
+    global output_dir, minimum_silence, word_limit, maximum_time, packed, index_path
+    output_dir = runner.argument(parser, params, 'output')
+    index_path = metadata.index_path(output_dir, runner.argument(parser, params, 'shard'))
+    minimum_silence = runner.argument(parser, params, 'minimum_silence')
+    word_limit = runner.argument(parser, params, 'word_limit')
+    maximum_time = runner.argument(parser, params, 'maximum_time')
+    packed = runner.argument(parser, params, 'packed')
+    cache.configure(runner.argument(parser, params, 'cache_dir'))
+    writer.configure(runner.argument(parser, params, 'write_threads'))
+
+
+configure({})
+
+
+# check if track contains any note on messages
+# takes track event array as parameter and returns boolean
+def has_note_on(track):
+    return events.has_note_on(track)
+
+
+# returns tempo of EventTable passed as parameter
+def find_tempo(table):
+    return cache.fact(table, 'tempo')
+
+
+# returns channel number of EventTable passed as parameter
+def find_channel(table):
+    return cache.fact(table, 'channel')
+
+
+# returns first program change of EventTable passed as parameter,
+# as an event row with time delta of 0, or None if not found
+def find_program_change(table):
+    found = cache.fact(table, 'program_change')
+    if found is None:
+        return None
+    program, channel = found
+    return events.make_row(events.PROGRAM_CHANGE, channel=channel, program=program)
+
+
+# create words from file passed by finding notes surrounded by silence,
+# returns list of saved file paths
+def create_words(filepath, table=None):
+    instruments = runner.load_instruments()
+
+    global word_limit
+    # check to see if word limit has been set
+    if word_limit is not None:
+        single_word_limit = word_limit
+
+    # paths of all files saved, returned for the stage manifest
+    outputs = []
+
+    # store file as EventTable obj, unless already loaded by the caller
+    if table is None:
+        with metrics.timed('parse'):
+            table = cache.load(filepath)
+    metrics.count('messages_processed', sum(len(rows) for rows in table.tracks))
+    note_rows = []
+
+    # new list of relevant messages, as event rows
+    for rows in table.tracks:
+        if has_note_on(rows):
+            is_note = (rows['type'] == events.NOTE_ON) | (
+                rows['type'] == events.NOTE_OFF)
+            note_rows.append(rows[is_note])
+    note_rows = np.concatenate(
+        note_rows) if note_rows else np.empty(0, dtype=events.EVENT_DTYPE)
+    is_on = (note_rows['type'] == events.NOTE_ON) & (note_rows['velocity'] > 0)
+
+    # accumulated time of each message index in ticks, and in seconds using
+    # the tempo map of the whole file, built once per file. The seconds of
+    # the message before and after each index are kept to measure silences
+    tmap = cache.fact(table, 'tempo_map')
+    acc_time_index = np.cumsum(note_rows['delta'])
+    acc_seconds = events.ticks_to_seconds(
+        acc_time_index, tmap, table.ticks_per_beat)
+    previous_seconds = events.ticks_to_seconds(
+        acc_time_index - note_rows['delta'], tmap, table.ticks_per_beat)
+    # the last message has no next message, its own time delta is used instead
+    next_times = np.append(note_rows['delta'][1:], note_rows['delta'][-1:])
+    next_seconds = events.ticks_to_seconds(
+        acc_time_index + next_times, tmap, table.ticks_per_beat)
+
+    # flag messages that leave all notes off before a long enough silence,
+    # and find the words between them as index ranges
+    ends = silence.silent_ends(note_rows['note'], is_on,
+                               next_seconds - previous_seconds, minimum_silence)
+    ranges = silence.word_ranges(ends, acc_seconds - previous_seconds,
+                                 minimum_silence)
+    acc_seconds = acc_seconds.tolist()
+
+    # rows of every word saved, for the metadata index
+    items = []
+    header = metadata.header_fields(table)
+
+    for i, end in ranges:
+        # check if word limit is exceeded here
+        if word_limit is not None and single_word_limit == 0:
+            break
+
+        # create word, set first note_on time delta to 0 to trim any
+        # start silence
+        word = note_rows[i:end].copy()
+        word['delta'][0] = 0
+
+        # music track holding the program change and the word, timed alone
+        # to determine absolute time of word for metadata
+        program_change = find_program_change(table)
+        music_rows = word if program_change is None else np.concatenate([program_change, word])
+
+        # save word metadata to json formatted string
+        current_time = acc_seconds[i]
+
+        word_dict = {
+            'file': filepath,
+            'offset': i,
+            'wavelength': len(word),
+            'start_time_seconds': ('%.2f' % current_time),
+            'total_length_seconds': ('%.2f' % events.length([music_rows], table.ticks_per_beat))
+        }
+        meta_dict = json.dumps(word_dict)
+
+        # tracks of the word file, a header track containing same info as
+        # original file with the word metadata added as a text message, and
+        # the music track
+        extras = table.extras + [MetaMessage('text', text=str(word_dict), time=0)]
+        word_tracks = [np.concatenate([table.tracks[0], events.make_row(events.OTHER, data=len(table.extras))]),
+                       music_rows]
+        with metrics.timed('validate'):
+            length = events.length(word_tracks, table.ticks_per_beat)
+
+        try:
+            # save to new file if word within valid time range
+            if length > 0 and length <= maximum_time:
+                file_name = os.path.basename(filepath)
+                instrument = int(program_change['program'][0])
+                if packed:
+                    # append word to the packed shard of its instrument
+                    with metrics.timed('write'):
+                        outputs.append(shards.write(
+                            output_dir+'/words/', instruments[instrument], word_dict,
+                            smf.encode(word_tracks, table.ticks_per_beat, extras)))
+                    saved = outputs[-1]
+                else:
+                    word_dir = '/words/'+instruments[instrument]+'/'
+
+                    # written in the background, directories created once
+                    mid_path = output_dir+word_dir+'%s_%s_%d_%d.mid' % (
+                        file_name[:-4], instruments[instrument], i, len(word))
+                    with metrics.timed('write'):
+                        writer.write(mid_path, smf.encode(
+                            word_tracks, table.ticks_per_beat, extras))
+                    outputs.append(mid_path)
+                    saved = mid_path
+
+                    # print info to screen for development
+                    """
+                    print('\nFile name: %s' % filepath)
+                    for i, track in enumerate(word_tracks):
+                        print('Track number: %d' % (i+1))
+                        for msg in events.array_to_track(track, extras):
+                            print(msg)
+                        print(
+                            '\n____________________________________________________________________________________________________________________________________\n')
+                    """
+
+                    try:
+                        # save json file
+                        json_dir = '/word_metadata/' + \
+                            instruments[instrument]+'/'
+                        json_path = output_dir+json_dir+'%s_%s_%d_%d.json' % (
+                            file_name[:-4], instruments[instrument], i, len(word))
+                        with metrics.timed('write'):
+                            writer.write(json_path, meta_dict.encode())
+                        outputs.append(json_path)
+                    except:
+                        print('JSON object not created for file: %s\n' %
+                              filepath)
+                        for msg in events.array_to_track(word_tracks[0], extras):
+                            print(msg)
+                        print(
+                            '\n____________________________________________________________________________________________________________________________________\n____________________________________________________________________________________________________________________________________\n\n')
+
+                metrics.count('words_emitted')
+
+                # add to the metadata index
+                items.append(metadata.item(
+                    'word', word_dict, note_rows[i:end], length,
+                    header, instrument, instruments[instrument], saved))
+
+                # dacrement word limit for next loop
+                if word_limit is not None:
+                    single_word_limit -= 1
+            else:
+                metrics.count('words_rejected')
+
+        except:
+            metrics.count('words_errored')
+            print('Error with word creation for file: %s\nAttempted tile length %d' % (
+                filepath, length))
+            for msg in events.array_to_track(word_tracks[0], extras):
+                print(msg)
+            print(
+                '\n____________________________________________________________________________________________________________________________________\n____________________________________________________________________________________________________________________________________\n\n')
+
+    # every word file is written before the index and manifest list it
+    with metrics.timed('write'):
+        writer.flush()
+        metadata.replace(index_path, 'word', filepath, items)
+    return outputs
+
+
+# add all file paths to list, pass each file through create_words()
+def main(argv=None):
+    # parse the arguments and store as local variables
+    params = vars(parser.parse_args(argv))
+    metrics.reset()
+    configure(params)
+    input_dir = params['input']
+    jobs = params['jobs']
+    stage = runner.shard_name('word', params['shard'])
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    newlist = pack.files(input_dir)
+    newlist = runner.shard_files(newlist, input_dir, params['shard'])
+    stage_params = {'minimum_silence': params['minimum_silence'],
+                    'word_limit': params['word_limit'],
+                    'maximum_time': params['maximum_time'],
+                    'packed': params['packed']}
+    stage_manifest = manifest.Manifest(
+        output_dir+'/%s.jsonl' % runner.shard_name('words_manifest', params['shard']), stage_params)
+    todo = stage_manifest.pending(newlist, params['force'])
+    errors = []
+    for file, outputs in runner.run(create_words, todo, jobs, errors,
+                                    initializer=configure, initargs=(params,),
+                                    stage=stage):
+        stage_manifest.record(file, outputs)
+    stage_manifest.close()
+    runner.report_errors(errors, output_dir, stage)
+    metrics.report(output_dir, stage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Saves output files from a pool of background threads, so the search for
+# words and tiles goes on while earlier files are written. Writes are handed
+# to the threads in batches, and write() waits for the oldest batch when too
+# many are queued, so memory held by unwritten files stays bounded. Each
+# process has its own threads, and flush() is called before the paths
+# written are reported as saved
+
+
+# adds the --write_threads argument shared by the stages saving words and
+# tiles to an argument parser
+def add_arguments(parser):
+    parser.add_argument('-wt', '--write_threads', default=4, type=int,
+                        help="Number of threads in each process writing saved files in the background, 0 to write each file before going on. (Defaults to 4 if not specified)")
+
+
+# number of files handed to a thread at a time
+BATCH_SIZE = 32
+
+# number of batches queued for each thread before write() waits
+QUEUED_BATCHES = 2
+
+# number of writer threads, 0 to write files as they are passed
+threads = 4
+
+# thread pool, started by the first batch written in this process
+pool = None
+
+# directories already created by this process
+created = set()
+
+# files passed since the last batch was handed to the threads
+batch = []
+
+# futures of the batches handed to the threads, oldest first
+pending = deque()
+
+# exceptions raised by batches since the last flush
+failed = []
+
+
+# sets the number of writer threads, 0 to write files as they are passed.
+# Files already passed are written first
+def configure(count):
+    global threads, pool
+    flush()
+    if pool is not None and count != threads:
+        pool.shutdown()
+        pool = None
+    threads = count
+
+
+# creates a directory and its parents, once for each directory in a process
+def make_dirs(directory):
+    if directory not in created:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        created.add(directory)
+
+
+# writes a batch of (path, bytes) pairs, closing each file before the next
+def write_all(files):
+    for path, data in files:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+# records the exception of a finished batch, if it raised one
+def collect(future):
+    error = future.exception()
+    if error is not None:
+        failed.append(error)
+
+
+# hands the current batch to the threads, then waits for the oldest batches
+# while more are queued than the threads can take
+def submit():
+    global pool, batch
+    if pool is None:
+        pool = ThreadPoolExecutor(max_workers=threads)
+    pending.append(pool.submit(write_all, batch))
+    batch = []
+    while len(pending) > threads * QUEUED_BATCHES:
+        collect(pending.popleft())
+
+
+# saves bytes to file path, creating its directory first. Written in the
+# background unless threads is 0, errors are raised by the next flush()
+def write(path, data):
+    make_dirs(os.path.dirname(path))
+    if threads == 0:
+        write_all([(path, data)])
+        return
+    batch.append((path, data))
+    if len(batch) >= BATCH_SIZE:
+        submit()
+
+
+# waits until every file passed so far is written. Raises the first error
+# raised by a write since the last flush
+def flush():
+    if batch:
+        submit()
+    while pending:
+        collect(pending.popleft())
+    if failed:
+        error = failed[0]
+        del failed[:]
+        raise error
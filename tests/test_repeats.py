@@ -0,0 +1,92 @@
+import random
+import numpy as np
+import pytest
+from mido import Message, MetaMessage
+from emgen import events
+from emgen import repeats
+
+# messages the OTHER rows of the random event arrays stand for
+EXTRAS = [Message('control_change', control=7, value=100),
+          Message('control_change', control=7, value=80),
+          MetaMessage('text', text='a'),
+          MetaMessage('text', text='b')]
+
+
+# the search find_repeats replaced: every offset and wavelength compared
+# message by message. Returns list of (offset, wavelength, matched) with
+# matched the number of consecutive messages that repeat
+def brute_force(codes, lower_wavelength, upper_wavelength, maximal=False, limits=None):
+    found = []
+    for offset in range(len(codes)):
+        for wavelength in range(max(lower_wavelength, 1), upper_wavelength):
+            if limits is not None and wavelength > limits[offset]:
+                continue
+            matched = 0
+            while (matched < wavelength and offset+wavelength+matched < len(codes) and
+                   codes[offset+matched] == codes[offset+wavelength+matched]):
+                matched += 1
+            if matched == 0:
+                continue
+            if maximal and offset and codes[offset-1] == codes[offset+wavelength-1]:
+                continue
+            found.append((offset, wavelength, matched))
+    return found
+
+
+# returns a random event array of count rows drawn from few enough messages
+# that many of them repeat, with OTHER rows for the messages in EXTRAS
+def random_rows(r, count):
+    rows = np.zeros(count, dtype=events.EVENT_DTYPE)
+    for i in range(count):
+        code = r.choice([events.NOTE_ON, events.NOTE_ON, events.NOTE_OFF, events.OTHER])
+        if code == events.OTHER:
+            rows[i] = events.make_row(code, data=r.randrange(len(EXTRAS)),
+                                      delta=r.choice([0, 120]))[0]
+        else:
+            rows[i] = events.make_row(code, channel=0, note=r.choice([60, 62, 64]),
+                                      velocity=r.choice([0, 64]) if code == events.NOTE_ON else 0,
+                                      delta=r.choice([0, 120, 240]))[0]
+    rows['tick'] = np.cumsum(rows['delta'])
+    return rows
+
+
+# splits an event array into chunks of random size, as smf.stream yields them
+def random_chunks(r, rows):
+    chunks, start = [], 0
+    while start < len(rows):
+        size = r.randint(1, 20)
+        chunks.append(rows[start:start+size])
+        start += size
+    return chunks
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_find_repeats_matches_brute_force(seed):
+    r = random.Random(seed)
+    codes = [r.randrange(r.randint(1, 4)) for _ in range(r.randint(0, 60))]
+    lower, upper = r.randint(0, 4), r.randint(1, 30)
+    maximal = r.random() < 0.5
+    limits = None
+    if r.random() < 0.5:
+        limits = [r.randint(0, 30) for _ in codes]
+    assert list(repeats.find_repeats(codes, lower, upper, maximal, limits)) == \
+        brute_force(codes, lower, upper, maximal, limits)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_stream_repeats_matches_brute_force(seed):
+    r = random.Random(seed)
+    rows = random_rows(r, r.randint(0, 120))
+    lower, upper = r.randint(0, 4), r.randint(2, 24)
+    maximal = r.random() < 0.5
+    max_ticks = r.choice([None, 240, 600, 1200])
+    limits = None
+    if max_ticks is not None:
+        limits = repeats.wavelength_limits(rows['delta'], max_ticks).tolist()
+    expected = brute_force(repeats.encode_rows(rows, EXTRAS), lower, upper, maximal, limits)
+
+    found = list(repeats.stream_repeats(random_chunks(r, rows), EXTRAS, lower, upper, maximal,
+                                        max_ticks, block_size=r.randint(1, 16)))
+    assert [(offset, wavelength, matched) for offset, wavelength, matched, tile in found] == expected
+    for offset, wavelength, matched, tile in found:
+        assert np.array_equal(tile, rows[offset:offset+wavelength])
@@ -0,0 +1,67 @@
+import random
+import numpy as np
+import pytest
+from emgen import silence
+
+
+# the loop create_words used before silence.py: the state of every note is
+# kept in a dict, and each note off scans all of them. Returns list of the
+# flags of each message, 0 if it leaves every note off before a silence
+def original_flags(notes, is_note_off, velocities, gaps, minimum_silence):
+    note_dict = {i: {'on': False} for i in range(128)}
+    note_on_new = []
+    for i in range(len(notes)):
+        note_info = note_dict[notes[i]]
+        if not is_note_off[i] and velocities[i] > 0:
+            note_info['on'] = True
+            note_on_new.append(1)
+        else:
+            note_info['on'] = False
+            notes_on = [j for j in note_dict if note_dict[j]['on']]
+            if not notes_on and gaps[i] > minimum_silence:
+                note_on_new.append(0)
+            else:
+                note_on_new.append(1)
+    return note_on_new
+
+
+# the nested loop that cut words from those flags, the first message
+# following the last. Returns list of (start, end) index ranges
+def original_ranges(note_on_new, leads, minimum_silence):
+    ranges = []
+    for i in range(len(note_on_new)):
+        if note_on_new[i-1] == 0 and leads[i] > minimum_silence:
+            end = len(note_on_new)
+            for j in range(i, len(note_on_new)):
+                if note_on_new[j] == 0:
+                    end = j + 1
+                    break
+            ranges.append((i, end))
+    return ranges
+
+
+# returns random (notes, note off flags, velocities, gaps, leads) of count
+# messages, from few notes so they overlap, and silences in half seconds so
+# some equal the minimum
+def random_messages(r, count):
+    notes = np.array([r.choice([0, 60, 61, 127]) for _ in range(count)], dtype=np.int8)
+    is_note_off = np.array([r.random() < 0.4 for _ in range(count)])
+    velocities = np.array([0 if off else r.choice([0, 64]) for off in is_note_off], dtype=np.int8)
+    gaps = np.array([r.randint(0, 6) / 2 for _ in range(count)])
+    leads = np.array([r.randint(0, 6) / 2 for _ in range(count)])
+    return notes, is_note_off, velocities, gaps, leads
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_silence_matches_original_loop(seed):
+    r = random.Random(seed)
+    notes, is_note_off, velocities, gaps, leads = random_messages(r, r.randint(0, 80))
+    minimum_silence = r.choice([0, 1.0, 1.5])
+    is_on = ~is_note_off & (velocities > 0)
+
+    flags = original_flags(notes.tolist(), is_note_off.tolist(), velocities.tolist(),
+                           gaps.tolist(), minimum_silence)
+    ends = silence.silent_ends(notes, is_on, gaps, minimum_silence)
+    assert ends.tolist() == [flag == 0 for flag in flags]
+    assert silence.word_ranges(ends, leads, minimum_silence) == \
+        original_ranges(flags, leads.tolist(), minimum_silence)
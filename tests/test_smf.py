@@ -0,0 +1,103 @@
+import io
+import random
+import numpy as np
+import pytest
+from mido import MidiFile, MidiTrack, Message, MetaMessage
+from emgen import events
+from emgen import smf
+
+
+# returns a random message of a type smf reads from columns, or one it
+# hands to mido as OTHER
+def random_message(r, time):
+    channel = r.randrange(16)
+    choice = r.randrange(10)
+    if choice < 4:
+        return Message('note_on', channel=channel, note=r.randrange(128),
+                       velocity=r.choice([0, r.randrange(128)]), time=time)
+    if choice < 6:
+        return Message('note_off', channel=channel, note=r.randrange(128),
+                       velocity=r.randrange(128), time=time)
+    if choice == 6:
+        return Message('program_change', channel=channel, program=r.randrange(128), time=time)
+    if choice == 7:
+        return r.choice([Message('control_change', channel=channel, control=r.randrange(128),
+                                 value=r.randrange(128), time=time),
+                         Message('pitchwheel', channel=channel, pitch=r.randint(-8192, 8191), time=time)])
+    return r.choice([MetaMessage('set_tempo', tempo=r.randint(200000, 1000000), time=time),
+                     MetaMessage('key_signature', key=r.choice(events.KEY_NAMES), time=time),
+                     MetaMessage('time_signature', numerator=r.randint(1, 12),
+                                 denominator=r.choice([2, 4, 8]), time=time),
+                     MetaMessage('text', text=r.choice(['', 'intro', 'x' * 200]), time=time),
+                     MetaMessage('end_of_track', time=time)])
+
+
+# returns a random MidiFile, runs of the same channel message type and
+# channel left in so running status is written and read
+def random_midifile(r):
+    mid = MidiFile(type=r.choice([0, 1]), ticks_per_beat=r.choice([96, 480, 960]))
+    for _ in range(1 if mid.type == 0 else r.randint(1, 4)):
+        track = MidiTrack()
+        for _ in range(r.randint(0, 60)):
+            time = r.choice([0, 0, r.randrange(128), r.randrange(1 << 21)])
+            if track and r.random() < 0.3 and not track[-1].is_meta:
+                track.append(track[-1].copy(time=time))
+            else:
+                track.append(random_message(r, time))
+        mid.tracks.append(track)
+    return mid
+
+
+# returns the bytes mido saves a MidiFile as
+def mido_bytes(mid):
+    out = io.BytesIO()
+    mid.save(file=out)
+    return out.getvalue()
+
+
+# asserts two EventTables hold the same event arrays and messages
+def assert_same_table(table, expected):
+    assert (table.type, table.ticks_per_beat) == (expected.type, expected.ticks_per_beat)
+    assert len(table.tracks) == len(expected.tracks)
+    for rows, expected_rows in zip(table.tracks, expected.tracks):
+        assert np.array_equal(rows, expected_rows)
+    assert table.extras == expected.extras
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_decode_matches_mido(seed):
+    data = mido_bytes(random_midifile(random.Random(seed)))
+    table = smf.decode(data)
+    assert table is not None
+    assert_same_table(table, events.from_midifile(MidiFile(file=io.BytesIO(data))))
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_encode_matches_mido(seed):
+    mid = random_midifile(random.Random(seed))
+    table = events.from_midifile(mid)
+    assert smf.encode(table.tracks, table.ticks_per_beat, table.extras, table.type) == mido_bytes(mid)
+
+
+# columns read_track fills in, seconds are set by EventTable from the tempo map
+READ_COLUMNS = [name for name in events.EVENT_DTYPE.names if name != 'seconds']
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_read_track_chunks_match_decode(seed):
+    r = random.Random(seed)
+    data = mido_bytes(random_midifile(r))
+    table = smf.decode(data)
+    smf_type, ticks_per_beat, bounds = smf.read_header(data)
+    extras = []
+    for (start, end), rows in zip(bounds, table.tracks):
+        chunks = list(smf.read_track(data, start, end, extras, r.randint(1, 16)))
+        joined = np.concatenate(chunks) if chunks else np.empty(0, dtype=events.EVENT_DTYPE)
+        assert np.array_equal(joined[READ_COLUMNS], rows[READ_COLUMNS])
+    assert extras == table.extras
+
+
+def test_sysex_left_to_mido():
+    mid = MidiFile()
+    mid.tracks.append(MidiTrack([Message('sysex', data=[1, 2, 3])]))
+    assert smf.decode(mido_bytes(mid)) is None